@@ -0,0 +1,226 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the check pipeline on a synthetic cluster, without any ssh.
+
+Every checker of cbis_health_check and cbis_post_install_check is run through CheckEngine with a fake
+transport which answers the commands of the engine with the frames a real cluster of N nodes would send,
+and the time spent in every stage, as measured by CheckEngine.timings, is reported:
+    wait     reading the frames (from memory here, so it is only the cost of readline/read)
+    demux    decoding the frames
+    parse    call_back of the checkers
+    store    flush of the rows into sqlite
+    summary  summary queries of the checkers
+    format   CheckEngine._format (PrettyTable and the TXT/CSV report)
+
+usage: python benchmarks/bench_pipeline.py [--hosts 10,100,1000,5000] [--package health,post]
+
+Every (package, hosts) runs in its own python process so its peak memory (ru_maxrss) is its own.
+The engine runs on python 2, so does the benchmark.
+"""
+
+from __future__ import print_function
+
+import argparse
+import io
+import json
+import logging
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic import SyntheticCluster, UNDERCLOUD_LISTINGS, UNDERCLOUD_OUTPUTS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PACKAGES = {'health': ('cbis_health_check', 'cbis_health_check'),
+            'post': ('cbis_post_install_check', 'post_install_check')}
+
+STAGES = ['wait', 'demux', 'parse', 'store', 'summary', 'format']
+
+CHECK_ID_RE = re.compile(r'CBIS1 %s (\S+) ')
+ADDRESS_RE = re.compile(r"'([0-9.]+)'")
+CONFIG_PATH_RE = re.compile(r'sudo cat (/[^\s;]+)')
+
+
+class FakeProc(object):
+
+    def __init__(self, data):
+        self.stdout = io.BytesIO(data)
+
+    def wait(self):
+        return 0
+
+
+def frame(host, check_id, output):
+    data = output.encode('utf-8')
+    return ('CBIS1 %s %s 0 raw %d 0\n' % (host, check_id, len(data))).encode('utf-8') + data + b'\n'
+
+
+def worker(package, size):
+    package_dir, module_name = PACKAGES[package]
+    sys.path.insert(0, os.path.join(ROOT, package_dir))
+    engine_module = __import__(module_name)
+    checker_module = sys.modules['checker']
+    logging.disable(logging.WARNING)
+
+    cluster = SyntheticCluster(size)
+    checker_names = [cls.__name__ for cls in checker_module.BaseCheck.__subclasses__()]
+
+    # outputs are generated before the run so they are not part of any stage
+    generate_start = time.time()
+    frames = {}
+    transferred = 0
+    for cls in checker_module.BaseCheck.__subclasses__():
+        if cls.__name__ in UNDERCLOUD_OUTPUTS:
+            frames[cls.__name__] = {None: frame('undercloud', cls.__name__,
+                                                cluster.output(cls.__name__, None))}
+        elif issubclass(cls, checker_module.FactsCheck):
+            frames[cls.__name__] = dict([(host.address, frame(host.name, cls.__name__, cluster.facts(host)))
+                                         for host in cluster.hosts])
+        elif getattr(cls, 'config_file', None):
+            frames[cls.__name__] = dict([(host.address, frame(host.name, cls.__name__,
+                                                              cluster.config_file(cls.config_file, host)))
+                                         for host in cluster.hosts])
+        else:
+            frames[cls.__name__] = dict([(host.address, frame(host.name, cls.__name__,
+                                                              cluster.output(cls.__name__, host)))
+                                         for host in cluster.hosts])
+        if not issubclass(cls, (checker_module.FactsCheck, checker_module.ApiCheck)):
+            # the FactsCheck get the facts frames of the node and the ApiCheck the api frame, counted below
+            transferred += sum([len(data) for data in frames[cls.__name__].values()])
+    # CheckEngine.collect_api queries all the undercloud listings in one os_query.py session
+    frames['api'] = {None: frame('undercloud', 'api', json.dumps(dict([
+        (name, cluster.api_output(name)) for name in UNDERCLOUD_LISTINGS if name in checker_names])))}
+    transferred += len(frames['api'][None])
+    # CheckEngine.collect_facts gathers the facts of a node once for all the checks
+    frames['facts'] = dict([(host.address, frame(host.name, 'facts', cluster.facts(host))) for host in cluster.hosts])
+    transferred += sum([len(data) for data in frames['facts'].values()])
+    # CheckEngine.collect_config reads all the files of a node at once, the files of a command are only
+    # known when it is run so its frames are made then and their time is taken out of the run
+    config_generated = {'seconds': 0.0, 'bytes': 0}
+    generate_seconds = time.time() - generate_start
+
+    class BenchEngine(engine_module.CheckEngine):
+
+        def run_shell(self, cmd):
+            if cmd == 'cat /etc/hosts':
+                return FakeProc(cluster.etc_hosts().encode('utf-8'))
+            check_id = CHECK_ID_RE.search(cmd).group(1)
+            if check_id == 'config':
+                return FakeProc(b''.join([self._config_frame(address, CONFIG_PATH_RE.findall(cmd))
+                                          for address in ADDRESS_RE.findall(cmd)]))
+            check_frames = frames[check_id]
+            if None in check_frames:
+                return FakeProc(check_frames[None])
+            return FakeProc(b''.join([check_frames[address] for address in ADDRESS_RE.findall(cmd)]))
+
+        @staticmethod
+        def _config_frame(address, paths):
+            start = time.time()
+            host = cluster.by_address[address]
+            data = frame(host.name, 'config', ''.join(['%s%d\n%s\n' % (engine_module.BATCH_MARKER, index,
+                                                                        cluster.config_file(path, host))
+                                                      for index, path in enumerate(paths)]))
+            config_generated['seconds'] += time.time() - start
+            config_generated['bytes'] += len(data)
+            return data
+
+        def get_db_connection(self, in_memory=False):
+            # the EthToolCheck baseline must not land next to the real one
+            return engine_module.CheckEngine.get_db_connection(self, in_memory=True)
+
+    output_dir = tempfile.mkdtemp(prefix='cbis_bench_')
+    try:
+        engine = BenchEngine(uc='bench', test_flag=False, output_file=os.path.join(output_dir, 'report.txt'),
+                             output_csv_file=os.path.join(output_dir, 'report.csv'), multiplex=False,
+                             probe=False)
+        start = time.time()
+        cpu_start = time.clock() if not hasattr(time, 'process_time') else time.process_time()
+        engine.check(checker_names)
+        cpu = (time.clock() if not hasattr(time, 'process_time') else time.process_time()) - cpu_start
+        seconds = {'run': time.time() - start - config_generated['seconds']}
+        engine.close()
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    for stage in STAGES:
+        seconds[stage] = sum([wall for (check, name), (wall, _, _) in engine.timings.stages.items()
+                              if name == stage])
+    outputs = sum([counts[0] for counts in engine.timings.outputs.values()])
+    distinct = sum([counts[1] for counts in engine.timings.outputs.values()])
+
+    return {'package': package, 'hosts': len(cluster.hosts), 'checks': len(checker_names),
+            'bytes': transferred + config_generated['bytes'],
+            'generate': generate_seconds + config_generated['seconds'], 'cpu': cpu,
+            'seconds': seconds, 'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'dedup': float(outputs) / distinct if distinct else 0.0}
+
+
+def report(results):
+    from prettytable import PrettyTable
+
+    table = PrettyTable(['package', 'hosts', 'MB in', 'run s', 'cpu s'] + ['%s s' % stage for stage in STAGES] +
+                        ['demux MB/s', 'parse hosts/s', 'dedup', 'peak RSS MB'])
+    for result in results:
+        seconds = result['seconds']
+        checked = result['hosts'] * result['checks']
+        row = [result['package'], result['hosts'], '%.1f' % (result['bytes'] / 1048576.0),
+               '%.2f' % seconds['run'], '%.2f' % result['cpu']]
+        row += ['%.3f' % seconds[stage] for stage in STAGES]
+        row += ['%.1f' % (result['bytes'] / 1048576.0 / seconds['demux']) if seconds['demux'] else '-',
+                '%.0f' % (checked / seconds['parse']) if seconds['parse'] else '-', '%.1fx' % result['dedup'],
+                '%.1f' % (result['maxrss_kb'] / 1024.0)]
+        table.add_row(row)
+    print(table)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Benchmark of the check pipeline on a synthetic cluster')
+
+    parser.add_argument('--hosts', default='10,100,1000',
+                        help='Comma separated cluster sizes')
+
+    parser.add_argument('--package', default='health,post',
+                        help='Comma separated packages to run (health, post)')
+
+    parser.add_argument('--json', metavar='FILE',
+                        help='Also write the results to FILE')
+
+    parser.add_argument('--worker', nargs=2, metavar=('PACKAGE', 'HOSTS'),
+                        help=argparse.SUPPRESS)
+
+    return parser
+
+
+def main(args=sys.argv[1:]):
+    args = build_parser().parse_args(args)
+
+    if args.worker:
+        print(json.dumps(worker(args.worker[0], int(args.worker[1]))))
+        return 0
+
+    results = []
+    for package in args.package.split(','):
+        for size in args.hosts.split(','):
+            cmd = [sys.executable, os.path.abspath(__file__), '--worker', package, size]
+            output = subprocess.check_output(cmd)
+            results.append(json.loads(output.decode('utf-8').strip().splitlines()[-1]))
+            print('%s %s hosts: %.2fs' % (package, size, results[-1]['seconds']['run']), file=sys.stderr)
+
+    report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
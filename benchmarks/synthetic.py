@@ -0,0 +1,284 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Synthetic cluster for the benchmarks: an /etc/hosts of N overcloud nodes and, for every checker of
+cbis_health_check and cbis_post_install_check, the output its command prints on a node.
+The checks reading a config file (ConfigCheck) get the content of the file from CONFIG_FILES,
+the checks on the node facts (FactsCheck) get the output of facts.FACTS_CMD from facts() and the
+undercloud listings come as the legacy CLI tables from output() or as os_query.py prints them from api_output().
+Every FAILING_EVERY-th node prints a failing output so the summaries have rows to report.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import json
+
+FAILING_EVERY = 7
+
+
+class SyntheticHost(object):
+
+    def __init__(self, role, index, address):
+        self.role = role
+        self.index = index
+        self.address = address
+        self.name = 'overcloud-%s-%d' % (role, index)
+        self.failing = index % FAILING_EVERY == FAILING_EVERY - 1
+
+
+class SyntheticCluster(object):
+
+    def __init__(self, size):
+        controllers = 3
+        storages = max(1, size // 10)
+        computes = max(1, size - controllers - storages)
+        self.hosts = []
+        for role, count in (('controller', controllers), ('compute', computes), ('cephstorage', storages)):
+            for index in range(count):
+                number = len(self.hosts) + 1
+                self.hosts.append(SyntheticHost(role, index, '10.%d.%d.%d' % (number // 65536 % 256,
+                                                                              number // 256 % 256, number % 256)))
+        self.by_address = dict([(host.address, host) for host in self.hosts])
+
+    def etc_hosts(self):
+        return ''.join(['%s %s.localdomain %s\n' % (host.address, host.name, host.name) for host in self.hosts])
+
+    def role(self, role):
+        return [host for host in self.hosts if host.role == role]
+
+    def output(self, check_name, host):
+        """Output of check_name on host, None for the undercloud"""
+        if host is None:
+            return UNDERCLOUD_OUTPUTS[check_name](self)
+        return NODE_OUTPUTS[check_name](self, host)
+
+    def api_output(self, check_name):
+        """Output of os_query.py for the listing of check_name"""
+        header, rows = UNDERCLOUD_LISTINGS[check_name](self)
+        return ''.join(['%s\n' % json.dumps([str(value) for value in row]) for row in [header] + rows])
+
+    def config_file(self, path, host):
+        return CONFIG_FILES[path](self, host)
+
+    def facts(self, host):
+        """Output of facts.FACTS_CMD on host"""
+        vf_num = 14 if host.role == 'compute' and not host.index % 2 else 0
+        hugepagesize = '1048576 kB' if host.role == 'compute' and not host.failing else '2048 kB'
+        return 'vf_num=%s\nvfs=%d\nvfs_trust_off=%d\ncpus=56\ncpu_frequency= %s (asserted by call to hardware)\n' \
+               'mem=Mem:           251G        %dG        %dG        1.0G        10G         150G\n' \
+               'nics=lo eno1 eno2 ens6f0 ens6f1 ens6f0_0 ens6f0_1\n' \
+               'meminfo.MemTotal=263518828 kB\nmeminfo.AnonHugePages=0 kB\nmeminfo.HugePages_Total=%d\n' \
+               'meminfo.HugePages_Free=%d\nmeminfo.HugePages_Rsvd=0\nmeminfo.HugePages_Surp=0\n' \
+               'meminfo.Hugepagesize=%s\n' % \
+               (vf_num or '', 48 if host.failing else 56, 1 if host.failing else 0,
+                '800 MHz' if host.failing else '2.10 GHz', 240 if host.failing else 100, 11 if host.failing else 151,
+                0 if host.failing else 200, 0 if host.failing else 120, hugepagesize)
+
+
+def _pcs_status(cluster, host):
+    output = 'Cluster name: tripleo_cluster\nStack: corosync\n'
+    for resource in ('rabbitmq', 'galera', 'redis', 'haproxy'):
+        output += ' Clone Set: %s-clone [%s]\n     Started: [ %s ]\n' % \
+                  (resource, resource, ' '.join([node.name for node in cluster.role('controller')]))
+    if host.failing:
+        output += '     Stopped: [ %s ]\n' % host.name
+    return output
+
+
+def _pcs_cluster_status(cluster, host):
+    return 'Cluster Status:\n Online\nPCSD Status:\n' + \
+           ''.join(['  %s: %s\n' % (node.name, 'Offline' if node.failing else 'Online')
+                    for node in cluster.role('controller')])
+
+
+def _ceph_osd_tree(cluster, host):
+    output = 'ID WEIGHT TYPE NAME UP/DOWN REWEIGHT\n-1 %d.0 root default\n' % len(cluster.role('cephstorage'))
+    osd = 0
+    for node in cluster.role('cephstorage'):
+        output += '-%d 1.0     host %s\n' % (osd + 2, node.name)
+        for disk in range(4):
+            output += ' %d 0.25         osd.%d  %s  1.0\n' % (osd, osd, 'down' if node.failing and disk == 0
+                                                              else 'up')
+            osd += 1
+    return output
+
+
+def _ceph_service(cluster, host):
+    output = ''
+    for disk in range(4):
+        output += '● ceph-osd@%d.service - Ceph object storage daemon\n   Active: %s\n' % \
+                  (disk, 'failed (Result: exit-code)' if host.failing and disk == 0 else 'active (running)')
+    return output
+
+
+def _ceph_osd_config(cluster, host):
+    return 'osd_scrub_chunk_min = %s\nosd_scrub_chunk_max = 5\nosd_scrub_sleep = 0.1\n' \
+           'osd_deep_scrub_stride = 1048576\n' % ('1' if host.failing else '5') * 4
+
+
+def _ntpq(cluster, host):
+    return '     remote           refid      st t when poll reach   delay   offset  jitter\n' \
+           '==============================================================================\n' + \
+           ''.join(['*ntp%d.example.com .GPS.  1 u  10   64  377    0.5   0.01   0.02\n' % n
+                    for n in range(2 if host.failing else 3)])
+
+
+def _ip_a(cluster, host):
+    return '4: ens6f0: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 9000\n' \
+           '5: ens6f1: <BROADCAST,MULTICAST%s> mtu 9000\n' % ('' if host.failing else ',UP,LOWER_UP')
+
+
+def _dump_flows(cluster, host):
+    output = 'NXST_FLOW reply (xid=0x4):\n'
+    for flow in range(200):
+        output += ' cookie=0x%s, duration=%d.1s, table=0, n_packets=%d, n_bytes=%d, idle_age=1, ' \
+                  'priority=4,in_port=2,dl_vlan=%d actions=mod_vlan_vid:%d,NORMAL\n' % \
+                  ('0' if host.failing and flow == 0 else '9a%x' % flow, flow, flow * 3, flow * 300,
+                   flow, flow + 100)
+    return output
+
+
+def _ethtool(cluster, host):
+    return ''.join(['%s\n     rx_discards_phy: %d\n' % (nic, host.index if host.failing else 0)
+                    for nic in ('ens1f0', 'ens1f1', 'ens3f0', 'ens3f1', 'ens6f0', 'ens6f1')])
+
+
+def _commented_options(section, count=40):
+    # the shipped config files mostly hold the commented defaults of every option
+    return ''.join(['\n# Help text of option %d of %s.\n#option_%d = <None>\n' % (n, section, n)
+                    for n in range(count)])
+
+
+def _nova_conf(cluster, host):
+    quota_members = 10 if host.failing and host.role == 'controller' else 60
+    cachemodes = 'file=directsync' if host.failing and host.role == 'compute' else 'network=writeback'
+    return '[DEFAULT]\n' + _commented_options('DEFAULT') + \
+        'scheduler_max_attempts = 100\n' \
+        'scheduler_default_filters = ServerGroupAffinityFilter,ServerGroupAntiAffinityFilter,' \
+        'AggregateInstanceExtraSpecsFilter,AvailabilityZoneFilter,RetryFilter,NUMATopologyFilter,' \
+        'PciPassthroughFilter,RamFilter,ComputeFilter,ImagePropertiesFilter,CoreFilter\n' \
+        'quota_server_groups = 100\nquota_server_group_members = %d\ndebug = False\n\n' \
+        '[libvirt]\n%sdisk_cachemodes = %s\nsync_power_state_interval = -1\n' % \
+        (quota_members, _commented_options('libvirt'), cachemodes)
+
+
+def _table(header, rows):
+    """Table as printed by the OpenStack CLIs"""
+    widths = [max([len(str(value)) for value in column]) for column in zip(header, *rows)]
+    line = '+%s+\n' % '+'.join(['-' * (width + 2) for width in widths])
+    output = line
+    for row in [header] + rows:
+        output += '|%s|\n' % '|'.join([' %s ' % str(value).ljust(width) for value, width in zip(row, widths)])
+        if row is header:
+            output += line
+    return output + line
+
+
+def _nova_service_list(cluster):
+    rows = []
+    for host in cluster.hosts:
+        binaries = ['nova-compute'] if host.role == 'compute' else \
+            ['nova-conductor', 'nova-scheduler', 'nova-consoleauth'] if host.role == 'controller' else []
+        for binary in binaries:
+            rows.append([len(rows) + 1, binary, host.name + '.localdomain', 'nova', 'enabled',
+                         'down' if host.failing else 'up', '2019-01-01T00:00:00.000000', '-'])
+    return ['Id', 'Binary', 'Host', 'Zone', 'Status', 'State', 'Updated_at', 'Disabled Reason'], rows
+
+
+def _nova_list(cluster):
+    rows = []
+    for host in cluster.role('compute'):
+        for vm in range(4):
+            rows.append(['%08x-0000-0000-0000-000000000000' % len(rows), host.name + '.localdomain',
+                         'vm-%s-%d' % (host.name, vm), 'ERROR' if host.failing and vm == 0 else 'ACTIVE',
+                         'Running'])
+    return ['ID', 'Host', 'Name', 'Status', 'Power State'], rows
+
+
+def _neutron_agent_list(cluster):
+    rows = []
+    for host in cluster.hosts:
+        if host.role == 'cephstorage':
+            continue
+        for agent in ('Open vSwitch agent', 'Metadata agent' if host.role == 'controller' else 'NIC Switch agent'):
+            rows.append(['%08x-0000-0000-0000-000000000000' % len(rows), agent, host.name + '.localdomain',
+                         'xxx' if host.failing else ':-)', 'True', 'neutron-agent'])
+    return ['id', 'agent_type', 'host', 'alive', 'admin_state_up', 'binary'], rows
+
+
+def _cinder_service_list(cluster):
+    rows = []
+    for host in cluster.role('controller'):
+        for binary in ('cinder-scheduler', 'cinder-volume'):
+            rows.append([binary, host.name, 'nova', 'enabled', 'down' if host.failing else 'up',
+                         '2019-01-01T00:00:00.000000', '-'])
+    return ['Binary', 'Host', 'Zone', 'Status', 'State', 'Updated_at', 'Disabled Reason'], rows
+
+
+def _ironic_node_list(cluster):
+    return ['UUID', 'Name', 'Instance UUID', 'Power State', 'Provisioning State', 'Maintenance'], \
+        [['%08x-0000-0000-0000-000000000000' % n, host.name, '%08x-1111-0000-0000-000000000000' % n,
+          'power off' if host.failing else 'power on', 'active', 'False']
+         for n, host in enumerate(cluster.hosts)]
+
+
+NODE_OUTPUTS = {
+    # cbis_health_check
+    'PCSStatus': _pcs_status,
+    'PCSClusterStatus': _pcs_cluster_status,
+    'CephHealth': lambda cluster, host: 'HEALTH_WARN 1 osds down\n' if host.failing else 'HEALTH_OK\n',
+    'CephOSDTree': _ceph_osd_tree,
+    'CephService': _ceph_service,
+    'CephOSDConfig': _ceph_osd_config,
+    'NTPStatus': _ntpq,
+    'NTPStat': lambda cluster, host: 'unsynchronised\n' if host.failing else
+    'synchronised to NTP server (10.0.0.1) at stratum 2\n',
+    'IPAEns6F0andEns6F1Interface': _ip_a,
+    'OvsvsctlGetFailMode': lambda cluster, host: 'standalone\n' if host.failing else 'secure\n',
+    'OvsofctlDumpflow': _dump_flows,
+    'EthToolCheck': _ethtool,
+    'StorageSSDCheck': lambda cluster, host: ''.join(['252:%d %s\n' % (disk, 'HDD' if host.failing else 'SSD')
+                                                      for disk in range(2)]),
+    # cbis_post_install_check
+    'NTP': lambda cluster, host: '      Local time: Thu 2019-01-01 00:00:00 UTC\n     NTP enabled: yes\n'
+                                 'NTP synchronized: %s\n' % ('no' if host.failing else 'yes'),
+    'BMCColdRedundency': lambda cluster, host: ' 01 %s\n' % ('01' if host.failing else '00'),
+    'APCIPadDisable': lambda cluster, host: 'BOOT_IMAGE=/vmlinuz-3.10.0 root=UUID=0 ro%s quiet\n' %
+                                            ('' if host.failing else ' acpi_pad.disable=1'),
+    'RabbitMqBacklog': lambda cluster, host: '      {tcp_listen_options,[{backlog,%d},{nodelay,true}]},\n' %
+                                             (128 if host.failing else 4096),
+    'SriovZombieScript': lambda cluster, host:
+    'ls: cannot access /zabbix_utils/zombie_vf.sh: No such file or directory\n' if host.failing
+    else '/zabbix_utils/zombie_vf.sh\n',
+}
+
+CONFIG_FILES = {
+    '/etc/nova/nova.conf': _nova_conf,
+    '/etc/cinder/cinder.conf': lambda cluster, host: '[DEFAULT]\n%sscheduler_max_attempts = %d\n' %
+                                                     (_commented_options('DEFAULT'), 3 if host.failing else 100),
+    '/etc/vitrage/vitrage.conf': lambda cluster, host: '[DEFAULT]\n%senable_host_evacuate = %s\n' %
+                                                       (_commented_options('DEFAULT', 10), host.failing),
+    '/etc/zabbix/zabbix_server.conf': lambda cluster, host: '%sStartPingers=%d\nStartPollers=20\nLogFileSize=0\n' %
+                                                            (_commented_options('zabbix'), 1 if host.failing else 3),
+    '/etc/openstack-dashboard/local_settings': lambda cluster, host: 'import os\nDEBUG = False\nTIME_ZONE = "%s"\n' %
+                                                                     ('UTC' if host.failing else 'Asia/Bangkok'),
+}
+
+# header and rows of the OpenStack listings
+UNDERCLOUD_LISTINGS = {
+    'NoveServiceList': _nova_service_list,
+    'NovaList': _nova_list,
+    'NeutronAgentList': _neutron_agent_list,
+    'CinderServiceList': _cinder_service_list,
+    'IronicNodelist': _ironic_node_list,
+}
+
+UNDERCLOUD_OUTPUTS = {
+    'UndercloudMTUConfig': lambda cluster: '/etc/sysconfig/network-scripts/ifcfg-eth0:MTU=9000\n'
+                                           '/etc/sysconfig/network-scripts/ifcfg-eth1:MTU=9000\n',
+    'UndercloudMTURuntime': lambda cluster: 'eth0: flags=4163<UP,BROADCAST,RUNNING,MULTICAST>  mtu 9000\n'
+                                            'eth1: flags=4163<UP,BROADCAST,RUNNING,MULTICAST>  mtu 9000\n'
+                                            'br-ctlplane: flags=4163<UP,BROADCAST,RUNNING,MULTICAST>  mtu 9000\n',
+}
+UNDERCLOUD_OUTPUTS.update([(name, lambda cluster, listing=listing: _table(*listing(cluster)))
+                           for name, listing in UNDERCLOUD_LISTINGS.items()])
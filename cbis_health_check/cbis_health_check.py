@@ -4,6 +4,7 @@
 from __future__ import print_function
 
 import argparse
+import base64
 import sys
 import os
 import logging.config
@@ -13,31 +14,213 @@ import re
 import datetime
 from prettytable import PrettyTable
 import uuid
+import collections
+import atexit
+import shutil
+import tempfile
+import threading
+import zlib
+import io
+import heapq
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 from checker import *
+import json
+import capture
+import configstore
+import facts
+import history
+import inventory
+import metrics
+import timings
 
 
 PATH = os.path.dirname(os.path.abspath(__file__))
 
+BATCH_MARKER = 'cbis_check: '
+# python of the node which runs collector.py, evaluated by the shell of the node
+# Every node answers with one frame per command:
+#   CBIS1 <host> <check> <exit status> <raw|gz64> <length> <milliseconds>\n<length bytes of output>\n
+# gz64 is the base64 of the gzipped output (--compress), milliseconds is how long the command ran on the node.
+# When ssh cannot reach a node the loop on the
+# undercloud prints a frame of check '-' with status 255 and the node address as host.
+FRAME_MAGIC = 'CBIS1'
+AGENT_PYTHON = '$(command -v python || command -v python3 || echo /usr/libexec/platform-python)'
+# host of the rows of the cluster_scope checks
+CLUSTER_HOST = 'cluster'
+# with --daemon the host inventory is read again after this many seconds, or --inventory_ttl when longer
+DAEMON_INVENTORY_REFRESH = 3600
+# with --daemon only the reports of this many last runs are kept, unless --keep_reports
+DAEMON_KEEP_REPORTS = 100
+
+# every checker writes into this table, its summary() reads the rows back through a per check view
+RESULT_SCHEMA = ['CREATE TABLE IF NOT EXISTS %scheck_result '
+                 '(run_id text, check_name text, host text, key text, value text, detail text)',
+                 'CREATE INDEX IF NOT EXISTS %scheck_result_idx ON check_result (check_name, host, key)',
+                 'CREATE INDEX IF NOT EXISTS %scheck_result_run_idx ON check_result (run_id)']
+
 logger = logging.getLogger(__name__)
 logging.config.fileConfig(os.path.join(PATH, 'logging.ini'), disable_existing_loggers=False)
 
 
+class SSHControlPool(object):
+    """
+    Multiplexed ssh master connections shared by all checkers of a run.
+    The master to the undercloud lives on this host, the masters to the overcloud nodes
+    live on the undercloud since that is where the node hop starts.
+    """
+
+    def __init__(self, uc, persist=600):
+        self.uc = uc
+        self.persist = persist
+        self.local_dir = tempfile.mkdtemp(prefix='cbis_ssh_')
+        self.remote_prefix = '/tmp/cbis_ssh_%s' % uuid.uuid4().hex[:8]
+        self.started = False
+        self.remote_used = False
+        self.lock = threading.Lock()
+
+    def uc_options(self):
+        return ['-o', 'ControlMaster=auto', '-o', 'ControlPath=%s/%%C' % self.local_dir,
+                '-o', 'ControlPersist=%d' % self.persist]
+
+    def node_options(self):
+        self.remote_used = True
+        return '-o ControlMaster=auto -o ControlPath=%s_%%C -o ControlPersist=%d' % (self.remote_prefix, self.persist)
+
+    def start(self):
+        with self.lock:
+            if not self.started:
+                self.started = True
+                logger.info('Opening ssh master connection to %s' % self.uc)
+                subprocess.call(['ssh', '-o', 'LogLevel=error', '-M', '-f', '-N'] + self.uc_options() +
+                                ['stack@%s' % self.uc])
+
+    def close(self):
+        if self.started:
+            if self.remote_used:
+                subprocess.call(['ssh', '-o', 'LogLevel=error'] + self.uc_options() +
+                                ['stack@%s' % self.uc,
+                                 'for s in %s_*; do [ -S "$s" ] && ssh -o ControlPath="$s" -O exit node 2>/dev/null; '
+                                 'done; true' % self.remote_prefix])
+            with open(os.devnull, 'wb') as devnull:
+                subprocess.call(['ssh', '-o', 'LogLevel=error', '-o', 'ControlPath=%s/%%C' % self.local_dir,
+                                 '-O', 'exit', 'stack@%s' % self.uc], stderr=devnull)
+            self.started = False
+        shutil.rmtree(self.local_dir, ignore_errors=True)
+
+
 class CheckEngine(object):
 
-    def __init__(self, uc, test_flag, output_file, output_csv_file):
+    def __init__(self, uc, test_flag, output_file, output_csv_file, parallel=1, batch=False, multiplex=True,
+                 results_db=None, history_db=None, workers=1, inventory_ttl=0, probe=True, transport='ssh',
+                 agent=False, compress=False, record=None, replay=None, metrics_file=None):
         self.uc = uc
         self.test_flag = test_flag
+        self.parallel = max(parallel, 1)
+        self.batch = batch
+        self.workers = max(workers, 1)
+        self.probe = probe
+        self.transport = transport
+        self.agent = agent
+        self.compress = compress
+        self.recorder = capture.Recorder(record) if record else None
+        self.replayer = capture.Replayer(replay) if replay else None
+        self.metrics_file = metrics_file
+        self.metrics = metrics.TextFile(os.path.basename(PATH), uc)
+        self.db_lock = threading.RLock()
+        self.results_db = results_db
+        self.history_db = history_db
+        # counters kept from one run to the next, see get_baseline_connection
+        self.baseline_db = os.path.join(PATH, '%s.db' % uc)
+        self.conn = self.get_result_connection()
+        self.run_id = None
+        self.new_run(output_file, output_csv_file)
+        self.inventory = inventory.Inventory(self._load_hosts, os.path.join(PATH, '%s.hosts' % uc), inventory_ttl)
+        self.ssh_pool = None
+        if multiplex and not test_flag:
+            self.ssh_pool = SSHControlPool(uc)
+            atexit.register(self.close)
+
+    def new_run(self, output_file, output_csv_file):
+        """
+        Start a new run writing its report to output_file and output_csv_file.
+        The ssh connections and the inventory are kept, the rows of the previous run are dropped.
+        """
+        if self.run_id is not None:
+            with self.db_lock, self.conn:
+                self.conn.execute('DELETE FROM check_result WHERE run_id = ?', (self.run_id,))
         self.output_file = output_file
         self.output_csv_file = output_csv_file
+        self.timings_file = '%s-timings.json' % os.path.splitext(output_file)[0]
+        self.run_id = uuid.uuid4().hex
+        self.started_at = datetime.datetime.now()
+        self.records = []
+        self.timings = timings.Timings()
+        self.config_cache = configstore.ConfigCache()
+        self.facts = facts.FactsTable()
+        # exit status of the command of every (check, host)
+        self.exit_status = {}
+        # addresses of the nodes which refused ssh during this run, skipped by every later check
+        self.unreachable = set()
+
+    def run_daemon(self, check_names, report_files, keep_reports=DAEMON_KEEP_REPORTS):
+        """
+        Run every check again each check.interval seconds until interrupted.
+        The checks due at the same time run together as one run with its own report.
+        :param report_files: function returning the TXT and CSV report files of a run started at a given time
+        :param keep_reports: number of runs whose reports are kept, the reports of the older runs are removed
+        """
+        due = [(0, index, name) for index, name in enumerate(check_names)]
+        heapq.heapify(due)
+        inventory_loaded = time.time()
+        # report files of the last runs, oldest first
+        reports = collections.deque()
+        while True:
+            now = time.time()
+            if due[0][0] > now:
+                time.sleep(due[0][0] - now)
+                continue
+            batch = []
+            while due and due[0][0] <= now:
+                batch.append(heapq.heappop(due))
+            batch.sort(key=lambda item: item[1])
+
+            if now - inventory_loaded > max(self.inventory.ttl, DAEMON_INVENTORY_REFRESH):
+                self.inventory.invalidate()
+                inventory_loaded = now
+            self.new_run(*report_files(datetime.datetime.now()))
+            reports.append((self.output_file, self.output_csv_file, self.timings_file))
+            names = [name for _, _, name in batch]
+            logger.info('Running %s' % ', '.join(names))
+            try:
+                self.check(names)
+            except Exception:
+                logger.exception('Run of %s failed' % ', '.join(names))
+            while len(reports) > max(keep_reports, 1):
+                for path in reports.popleft():
+                    # two runs started within the same second share their report
+                    if path not in reports[-1] and os.path.exists(path):
+                        os.remove(path)
+
+            # a check slower than its interval runs again right after itself
+            for _, index, name in batch:
+                heapq.heappush(due, (max(now + globals()[name].interval, time.time()), index, name))
+
+    def close(self):
+        if self.ssh_pool is not None:
+            self.ssh_pool.close()
+            self.ssh_pool = None
 
-    def _format(self, checker, output_file, output_csv_file):
+    def _format(self, checker, output, output_file, output_csv_file):
 
         table = PrettyTable(['host', 'status'])
         table.align["host"] = "l"
         table.title = checker.__doc__
         table.title_align = 'l'
         table.header_style = 'title'
-        output = checker.check()
         line_list = output.splitlines()
 
         csv_records = []
@@ -54,21 +237,336 @@ class CheckEngine(object):
         output_file.write('%s\n' % table)
         output_file.flush()
 
+        self.records.extend([(checker.__class__.__name__, record[0], record[1]) for record in csv_records])
         for record in csv_records:
             output_csv_file.write('"%s",%s,%s\n' % (checker.__doc__.replace('\n', ' '), record[0], record[1]))
         output_csv_file.flush()
 
     def check_all(self):
         checker_list = [cls(self) for cls in BaseCheck.__subclasses__()]
-        with open(self.output_file, 'wb') as f, open(self.output_csv_file, 'wb') as f_csv:
-            for checker in checker_list:
-                self._format(checker, output_file=f, output_csv_file=f_csv)
+        self._check_list(checker_list)
 
     def check(self, args):
+        checker_list = [globals()[arg_name](self) for arg_name in args]
+        self._check_list(checker_list)
+
+    def _check_list(self, checker_list):
+        # a replay only reads the captures, the cluster is not touched
+        remote = not self.test_flag and self.replayer is None
+        if self.probe and self.transport == 'ssh' and remote:
+            with self.timings.measure('-', 'probe'):
+                self.probe_hosts()
+        if remote:
+            self.collect_api(checker_list)
+            self.collect_facts(checker_list)
+        if self.agent and self.transport == 'ssh' and remote:
+            self.collect_agent(checker_list)
+        if remote:
+            self.collect_config(checker_list)
+        if self.batch and remote:
+            self.collect_batch(checker_list)
         with open(self.output_file, 'wb') as f, open(self.output_csv_file, 'wb') as f_csv:
-            for arg_name in args:
-                cls = globals()[arg_name]
-                self._format(cls(self), output_file=f, output_csv_file=f_csv)
+            # checkers run concurrently but are written in checker_list order
+            for checker, output in zip(checker_list, self._run_pool(lambda checker: checker.check(), checker_list)):
+                with self.timings.measure(checker.__class__.__name__, 'format'):
+                    self._format(checker, output, output_file=f, output_csv_file=f_csv)
+            f.write(self.timings.section())
+        self.timings.write(self.timings_file)
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.results_db:
+            self.save_results()
+        if self.history_db:
+            history.HistoryStore(self.history_db).record(self.run_id, self.uc, self.started_at, self.records)
+        if self.metrics_file:
+            metrics.add_run(self.metrics, checker_list, self.records, self.timings)
+            self.metrics.write(self.metrics_file)
+
+    def collect_batch(self, checker_list):
+        """
+        Group checkers by host_pattern and run all their commands in one ssh session per node.
+        Every command is preceded by a BATCH_MARKER line so the node output can be split
+        back into one block per checker before it reaches the checker's call_back.
+        """
+        groups = collections.OrderedDict()
+        for checker in checker_list:
+            # a batch runs on every node of the pattern, or on its SR-IOV nodes only
+            if not checker.collected and not checker.cluster_scope:
+                groups.setdefault((checker.host_pattern(), checker.sriov_only), []).append(checker)
+
+        def collect(group):
+            (host_pattern, _), checkers = group
+            # the echo ends an output without a final new line before the next marker
+            cmd = '; '.join(['echo "%s%s"; %s; echo' % (BATCH_MARKER, checker.__class__.__name__,
+                                                        checker.cmd().strip().rstrip(';'))
+                             for checker in checkers])
+            unreachable = self.run(host_pattern=host_pattern, cmd=cmd, callback=self._batch_callback(checkers),
+                                   check_id='batch', hosts=self.applicable_hosts(checkers[0]))
+            for checker in checkers:
+                checker.collected = True
+                checker.unreachable = unreachable
+
+        list(self._run_pool(collect, [group for group in groups.items() if len(group[1]) > 1]))
+
+    def collect_api(self, checker_list):
+        """
+        Query the OpenStack listings of all the ApiCheck with os_query.py in one session on the undercloud,
+        with one keystoneauth1 session and token per cloud instead of one CLI client start per check.
+        os_query.py falls back to the legacy command of a check when its listing cannot be had from the API.
+        """
+        checkers = [checker for checker in checker_list if isinstance(checker, ApiCheck) and not checker.collected]
+        if not checkers:
+            return
+        with open(os.path.join(PATH, 'os_query.py'), 'rb') as f:
+            script = base64.b64encode(f.read()).decode('ascii')
+        spec = json.dumps([[checker.__class__.__name__, checker.query, checker.rc_file, checker.cmd()]
+                           for checker in checkers])
+        # the script is read by python from its stdin, as collector.py on the nodes
+        cmd = 'echo %s | base64 -d | %s - %s' % (script, AGENT_PYTHON,
+                                                 base64.b64encode(spec.encode('utf-8')).decode('ascii'))
+        self.run_xargs(host_pattern='undercloud', cmd=cmd, callback=self._agent_callback(checkers, 'os_query.py'),
+                       check_id='api')
+        for checker in checkers:
+            checker.collected = True
+
+    def collect_facts(self, checker_list):
+        """
+        Gather the facts of the nodes (facts.FACT_COMMANDS) in one session per node before any other command.
+        The FactsCheck are evaluated from them, with the same text for all the checks of a node so the facts
+        are parsed once per node, and they tell which nodes the sriov_only checks run on.
+        """
+        facts_checkers = [checker for checker in checker_list
+                          if isinstance(checker, FactsCheck) and not checker.collected]
+        hosts = collections.OrderedDict()
+        # inventory name -> FactsCheck of the node, a node may have one /etc/hosts line per network
+        host_checkers = {}
+        for checker in checker_list:
+            if checker.collected or checker.host_pattern() == 'undercloud' or \
+                    not (checker in facts_checkers or checker.sriov_only):
+                continue
+            for host in self.inventory.hosts(self._node_pattern(checker.host_pattern())):
+                hosts[host.address] = host
+                if checker in facts_checkers and checker not in host_checkers.get(host.name, []):
+                    host_checkers.setdefault(host.name, []).append(checker)
+        if not hosts:
+            return
+
+        # the frames hold $(hostname) of the node, its short name or its FQDN, or the salt minion id
+        by_name = {}
+        for host in hosts.values():
+            for name in [host.name] + host.names:
+                by_name.setdefault(name, host)
+        # inventory names of the nodes which answered
+        answered = set()
+        lock = threading.Lock()
+
+        def callback(hostname, data, timestamp):
+            host = by_name.get(hostname, by_name.get(hostname.split('.')[0]))
+            if host is None:
+                logger.warning('Facts of %s match no node of the inventory, they are ignored' % hostname)
+                return
+            with lock:
+                # a node with several lines answers once per address, its facts are the same
+                if host.name in answered:
+                    return
+                answered.add(host.name)
+            # the facts are kept by inventory name, as the nodes are looked up by applicable_hosts
+            self.facts.get(host.name, data)
+            for checker in host_checkers.get(host.name, []):
+                checker.ingest(host.name, data, timestamp)
+
+        unreachable = self.run(host_pattern=None, cmd=facts.FACTS_CMD, callback=callback, check_id='facts',
+                               hosts=list(hosts.values()))
+        # a node which answered under a name matching none of the inventory is reported as unreachable
+        missing = []
+        for host in hosts.values():
+            if host.name not in answered and host.name not in unreachable and host.name not in missing:
+                missing.append(host.name)
+        if missing:
+            logger.warning('No facts from %s' % ', '.join(missing))
+        for checker in facts_checkers:
+            checker.collected = True
+            names = [host.name for host in self.inventory.hosts(self._node_pattern(checker.host_pattern()))]
+            checker.unreachable = [name for name in unreachable + missing if name in names]
+
+    def applicable_hosts(self, checker):
+        """
+        Nodes of checker.host_pattern the checker applies to from their facts,
+        None when the checker runs on all of them
+        """
+        if not checker.sriov_only or checker.host_pattern() == 'undercloud':
+            return None
+        return [host for host in self.inventory.hosts(self._node_pattern(checker.host_pattern()))
+                if self._applicable(checker, host)]
+
+    def _applicable(self, checker, host):
+        # a node without facts, unreachable when they were gathered, is kept so it is reported as such
+        host_facts = self.facts.get(host.name)
+        return host_facts is None or checker.applicable(host_facts)
+
+    def collect_config(self, checker_list):
+        """
+        Read the config files of all the ConfigChecks sharing a host pattern in one session per node,
+        every file once whatever the number of checks on it. The same text of a file is given to all
+        its checks, so it is parsed once per host by config_cache.
+        """
+        groups = collections.OrderedDict()
+        for checker in checker_list:
+            if getattr(checker, 'config_file', None) and not checker.collected and not checker.cluster_scope:
+                groups.setdefault(checker.host_pattern(), []).append(checker)
+
+        def collect(group):
+            host_pattern, checkers = group
+            paths = []
+            for checker in checkers:
+                if checker.config_file not in paths:
+                    paths.append(checker.config_file)
+            # every file is preceded by a marker with its index in paths,
+            # the echo ends a file without a final new line before the next marker
+            cmd = '; '.join(['echo "%s%d"; sudo cat %s; echo' % (BATCH_MARKER, index, path)
+                             for index, path in enumerate(paths)])
+            unreachable = self.run(host_pattern=host_pattern, cmd=cmd,
+                                   callback=self._config_callback(checkers, paths), check_id='config')
+            for checker in checkers:
+                checker.collected = True
+                checker.unreachable = unreachable
+
+        list(self._run_pool(collect, [group for group in groups.items() if len(group[1]) > 1]))
+
+    @staticmethod
+    def _config_callback(checkers, paths):
+        def callback(hostname, data, timestamp):
+            texts = {}
+            path = None
+            for line in data.split('\n\r')[:-1]:
+                if line.startswith(BATCH_MARKER):
+                    path = paths[int(line[len(BATCH_MARKER):])]
+                    texts[path] = []
+                elif path is not None:
+                    texts[path].append('%s\n\r' % line)
+            texts = dict([(path, ''.join(lines)) for path, lines in texts.items()])
+            for checker in checkers:
+                checker.ingest(hostname, texts.get(checker.config_file, ''), timestamp)
+
+        return callback
+
+    def collect_agent(self, checker_list):
+        """
+        Run the commands of all node checkers with a single collector.py process per node,
+        which prints the output of every command back as one json line.
+        The nodes needing the same checkers, in practice the nodes of one role, are collected together.
+        """
+        node_checkers = [checker for checker in checker_list if not checker.collected and
+                         checker.host_pattern() != 'undercloud' and not checker.cluster_scope]
+        host_checkers = collections.OrderedDict()
+        for checker in node_checkers:
+            for host in self.inventory.hosts(self._node_pattern(checker.host_pattern())):
+                if self._applicable(checker, host):
+                    host_checkers.setdefault(host.address, (host, []))[1].append(checker)
+        groups = collections.OrderedDict()
+        for host, checkers in host_checkers.values():
+            groups.setdefault(tuple(checkers), []).append(host)
+
+        # pushed once to the undercloud, every node reads it from the stdin of its ssh session
+        collector_file = '/tmp/health_check_%s_collector.py' % self.run_id
+        with open(os.path.join(PATH, 'collector.py'), 'rb') as f:
+            script = base64.b64encode(f.read()).decode('ascii')
+        cmd = 'echo %s | base64 -d > %s' % (script, collector_file)
+        self._wait(self.run_shell(cmd), 'echo ... | base64 -d > %s' % collector_file)
+
+        def collect(group):
+            checkers, hosts = group
+            spec = json.dumps([[checker.__class__.__name__, checker.cmd()] for checker in checkers])
+            cmd = 'sudo %s - %s' % (AGENT_PYTHON, base64.b64encode(spec.encode('utf-8')).decode('ascii'))
+            return self.run_xargs(host_pattern=None, cmd=cmd, callback=self._agent_callback(checkers),
+                                  hosts=hosts, stdin=collector_file, check_id='collector')
+
+        try:
+            for checkers, unreachable in zip(groups, self._run_pool(collect, list(groups.items()))):
+                for checker in checkers:
+                    checker.unreachable.extend([name for name in unreachable if name not in checker.unreachable])
+        finally:
+            self.run_shell('rm -f %s' % collector_file).wait()
+        for checker in node_checkers:
+            checker.collected = True
+
+    @staticmethod
+    def _agent_callback(checkers, script='collector.py'):
+        def callback(hostname, data, timestamp):
+            payload = None
+            for line in data.split('\n\r'):
+                if line.startswith('{'):
+                    payload = json.loads(line)
+            if payload is None:
+                logger.error('%s did not return anything on %s' % (script, hostname))
+                return
+            for checker in checkers:
+                output = payload.get(checker.__class__.__name__, '')
+                checker.ingest(hostname, ''.join(['%s\n\r' % line for line in output.splitlines()]), timestamp)
+
+        return callback
+
+    def _run_pool(self, func, items):
+        """
+        Call func for every item on up to self.workers threads.
+        The results are yielded in the order of items, each one as soon as it and all items before it are done.
+        """
+        if self.workers < 2 or len(items) < 2:
+            for item in items:
+                yield func(item)
+            return
+
+        tasks = queue.Queue()
+        for index, item in enumerate(items):
+            tasks.put((index, item))
+        results = [None] * len(items)
+        done = [threading.Event() for _ in items]
+
+        def worker():
+            while True:
+                try:
+                    index, item = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    results[index] = (True, func(item))
+                except Exception as e:
+                    logger.exception('Failed on %s' % item)
+                    results[index] = (False, e)
+                done[index].set()
+
+        for _ in range(min(self.workers, len(items))):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+
+        for index in range(len(items)):
+            # a timeout keeps the main thread responsive to Ctrl-C on python 2
+            while not done[index].wait(1):
+                pass
+            ok, result = results[index]
+            if not ok:
+                raise result
+            yield result
+
+    @staticmethod
+    def _batch_callback(checkers):
+        checker_map = dict([(checker.__class__.__name__, checker) for checker in checkers])
+
+        def callback(hostname, data, timestamp):
+            checker = None
+            lines = []
+            # run_xargs terminates every line with '\n\r', the last item is always empty
+            for line in data.split('\n\r')[:-1] + [BATCH_MARKER]:
+                if line.startswith(BATCH_MARKER):
+                    if checker is not None:
+                        checker.ingest(hostname, ''.join(['%s\n\r' % l for l in lines]), timestamp)
+                    checker = checker_map.get(line[len(BATCH_MARKER):].strip())
+                    lines = []
+                else:
+                    lines.append(line)
+
+        return callback
 
     def run_shell(self, cmd):
 
@@ -76,104 +574,330 @@ class CheckEngine(object):
 
         if self.test_flag:
             ssh_cmd = cmd.split(' ')
+        elif self.ssh_pool is not None:
+            self.ssh_pool.start()
+            ssh_cmd = ["ssh", "-o", "LogLevel=error"] + self.ssh_pool.uc_options() + ["stack@%s" % self.uc, cmd]
         else:
             ssh_cmd = ["ssh", "-o", "LogLevel=error", "stack@%s" % self.uc, cmd]
 
         return subprocess.Popen(ssh_cmd, stdout=subprocess.PIPE)
 
-    def run_xargs(self, host_pattern, cmd, callback):
-        now = datetime.datetime.now()
+    def _load_hosts(self):
+        proc = self.run_shell('cat /etc/hosts')
+        data = '\n'.join(self._read_lines(proc))
+        self._wait(proc, 'cat /etc/hosts')
+        return data
 
-        temp_file_name = '/tmp/health_check_%s' % str(uuid.uuid4())
+    @staticmethod
+    def _host_list(hosts):
+        return ' '.join("'%s'" % host.address.replace("'", "'\\''") for host in hosts)
+
+    def probe_hosts(self):
+        """
+        Try one ssh login on every overcloud node at the same time before any check runs,
+        so a node which is down costs one ConnectTimeout per run instead of one per check.
+        """
+        hosts = self.inventory.hosts('overcloud-*')
+        cmd = "for name in %s; do { %s cbis-admin@\"$name\" true >/dev/null 2>&1; %s; } & done; wait" % \
+              (self._host_list(hosts), self._node_ssh('-n '), self._unreachable_frame())
+        proc = self.run_shell(cmd)
+        self._demux_frames(proc.stdout, None, datetime.datetime.now())
+        self._wait(proc, cmd)
 
-        if host_pattern == '*':
-            host_pattern = 'overcloud-*'
+    def _add_unreachable(self, address):
+        if address not in self.unreachable:
+            logger.warning('%s is unreachable, it is skipped by the remaining checks' % address)
+            self.unreachable.add(address)
+
+    def _skipped(self, hosts):
+        """
+        Names of the unreachable hosts among hosts, a node with one line per network
+        is unreachable when none of its addresses is reachable
+        """
+        reachable = set([host.name for host in hosts if host.address not in self.unreachable])
+        names = []
+        for host in hosts:
+            if host.name not in reachable and host.name not in names:
+                names.append(host.name)
+        return names
+
+    def run(self, host_pattern, cmd, callback, check_id='-', hosts=None):
+        """
+        Run cmd on the nodes matching host_pattern with the selected transport
+        :param hosts: run on these inventory hosts instead of the ones matching host_pattern
+        """
+        if hosts is not None and not hosts and not self.test_flag:
+            return []
+        if self.transport == 'salt' and host_pattern != 'undercloud' and not self.test_flag:
+            if hosts is not None:
+                # the minion id is one of the names of the host, possibly with its domain
+                host_pattern = '(?:%s)(\\.|$)' % '|'.join(re.escape(name) for host in hosts for name in host.names)
+            return self.run_salt(host_pattern, cmd, callback, check_id)
+        return self.run_xargs(host_pattern, cmd, callback, hosts=hosts, check_id=check_id)
+
+    def run_once(self, host_pattern, cmd, callback, check_id='-'):
+        """
+        Run cmd on one node matching host_pattern, for the commands giving the same answer on all of them.
+        The nodes are tried in inventory order until cmd exits 0 on one, the output of the last node
+        tried is given to callback as the host CLUSTER_HOST.
+        :return: names of the matching nodes when none of them answered
+        """
+        hosts = self.inventory.hosts(self._node_pattern(host_pattern))
+        output = None
+        for host in hosts:
+            if host.address in self.unreachable:
+                continue
+            outputs = []
+            self.run(host_pattern, cmd, lambda hostname, data, timestamp: outputs.append((hostname, data, timestamp)),
+                     check_id, hosts=[host])
+            if not outputs:
+                continue
+            output = outputs[0]
+            if self.exit_status.get((check_id, output[0]), 0) == 0:
+                break
+            logger.warning('%s failed on %s, trying the next node' % (check_id, host.name))
+
+        if output is None:
+            return [host.name for host in hosts]
+        logger.info('%s answered by %s' % (check_id, output[0]))
+        callback(CLUSTER_HOST, output[1], output[2])
+        return []
+
+    @staticmethod
+    def _node_pattern(host_pattern):
+        return 'overcloud-*' if host_pattern == '*' else host_pattern
+
+    def run_xargs(self, host_pattern, cmd, callback, hosts=None, stdin=None, check_id='-'):
+        """
+        Run cmd on every node matching host_pattern and call callback once per node
+        :param hosts: run on these inventory hosts instead of the ones matching host_pattern
+        :param stdin: file of the undercloud given as stdin to cmd on every node
+        :param check_id: name of the check in the frames
+        :return: names of the matching nodes which were skipped because they are unreachable
+        """
+        now = datetime.datetime.now()
+
+        host_pattern = self._node_pattern(host_pattern)
         if self.test_flag:
-            cmd = cmd
-        elif host_pattern == 'undercloud':
-            cmd = 'echo \"hostname: `hostname`\"; %s ' % cmd
+            # the test log only has the legacy text output
+            proc = self.run_shell(cmd)
+            self._demux_text(self._read_lines(proc), callback, now)
+            self._wait(proc, cmd)
+            return []
+
+        if host_pattern == 'undercloud':
+            hosts = []
+            cmd = self._node_cmd(cmd, check_id)
         else:
-            cmd_host = 'grep -E \'%s\' /etc/hosts > %s' % (host_pattern, temp_file_name)
-            self.run_shell(cmd_host).wait()
+            if hosts is None:
+                hosts = self.inventory.hosts(host_pattern)
+            host_list = self._host_list([host for host in hosts if host.address not in self.unreachable])
 
-            cmd = "while read -r name <&3; do ssh -o ConnectTimeout=3 -o LogLevel=error " \
-                  "-o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no " \
-                  "cbis-admin@\"$name\" 'echo \"hostname: `hostname`\"; %s ' || true; done 3< %s; rm %s" % \
-                  (cmd, temp_file_name, temp_file_name)
+            if self.parallel > 1:
+                cmd = self._parallel_loop(cmd, host_list, stdin, check_id)
+            else:
+                cmd = "for name in %s; do %s cbis-admin@\"$name\" '%s'%s; %s; done" % \
+                      (host_list, self._node_ssh(), self._node_cmd(cmd, check_id), ' < %s' % stdin if stdin else '',
+                       self._unreachable_frame())
 
+        proc = self.run_shell(cmd)
+        self._demux_frames(proc.stdout, callback, now)
+        self._wait(proc, cmd)
+        return self._skipped(hosts)
+
+    def _node_cmd(self, cmd, check_id='-'):
+        """
+        Command run on a node for cmd, it prints the output of cmd as one frame.
+        The output is kept in a variable, the trailing x keeps its trailing new lines.
+        """
+        cmd = 't=$(date +%%s%%N); out=$({ %s ; }; r=$?; printf x; exit $r); rc=$?; out=${out%%x}; ' \
+              't=$((($(date +%%s%%N) - t) / 1000000)); ' % cmd.strip().rstrip(';')
+        encoding = 'raw'
+        if self.compress:
+            cmd += 'out=$(printf %s \"$out\" | gzip -c | base64 -w0); '
+            encoding = 'gz64'
+        return cmd + 'printf \"%s %%s %s %%d %s %%d %%d\\n%%s\\n\" \"$(hostname)\" $rc $(LC_ALL=C; echo ${#out}) $t ' \
+                     '\"$out\"' % \
+            (FRAME_MAGIC, check_id, encoding)
+
+    @staticmethod
+    def _unreachable_frame():
+        # ssh exits with 255 when it cannot log in
+        return '[ $? -ne 255 ] || printf \"%s %%s - 255 raw 0 0\\n\\n\" \"$name\"' % FRAME_MAGIC
+
+    def _demux_frames(self, stream, callback, timestamp):
+        """Call callback for the output of every frame of stream, as soon as the frame is complete"""
+        while True:
+            start = self.timings.start()
+            header = stream.readline()
+            if not header:
+                return
+            if not isinstance(header, str):
+                header = header.decode('utf-8', 'replace')
+            fields = header.split()
+            if len(fields) != 7 or fields[0] != FRAME_MAGIC:
+                if fields:
+                    logger.warning('Output outside of a frame: %s' % header.rstrip())
+                continue
+
+            host, check_id, status, encoding, length = fields[1], fields[2], int(fields[3]), fields[4], int(fields[5])
+            data = stream.read(length)
+            stream.readline()
+            start = self.timings.stop(start, check_id, 'wait', host)
+            if check_id == '-' and status == 255:
+                self._add_unreachable(host)
+                continue
+            self.timings.add(check_id, 'remote', int(fields[6]) / 1000.0, host=host)
+            if encoding == 'gz64':
+                data = zlib.decompress(base64.b64decode(data), 16 + zlib.MAX_WBITS)
+            if not isinstance(data, str):
+                data = data.decode('utf-8', 'replace')
+
+            self.exit_status[(check_id, host)] = status
+            data = ''.join(['%s\n\r' % line for line in data.splitlines()])
+            self.timings.stop(start, check_id, 'demux', host)
+            callback(host, data, timestamp)
+
+    @staticmethod
+    def _demux_text(lines, callback, timestamp):
+        """Split text output on its 'hostname: ' lines, used for the test log"""
         hostname_re = re.compile('hostname: ')
+        hostname = None
+        line_each_node = []
+        for line in lines:
+            if hostname_re.search(line):
+                if hostname is not None:
+                    callback(hostname, ''.join(line_each_node), timestamp)
+                hostname = line.split(':')[1].strip()
+                line_each_node = []
+            elif hostname is not None:
+                line_each_node.append('%s\n\r' % line)
+        if hostname is not None:
+            callback(hostname, ''.join(line_each_node), timestamp)
 
-        proc = self.run_shell(cmd)
-        stdout, stderr = proc.communicate()
-        if proc.returncode == 0:
-            lines = stdout.splitlines()
-            i = 0
-            while i < len(lines):
-                line = lines[i]
-                line_each_node = ''
-                if hostname_re.search(line):
-                    hostname = line.split(':')[1].strip()
-                    i += 1
-                    next_line = lines[i]
-                    while not hostname_re.search(next_line):
-                        line_each_node += '%s\n\r' % next_line
-                        i += 1
-                        try:
-                            next_line = lines[i]
-                        except IndexError:
-                            break
-                    callback(hostname, line_each_node, now)
-                else:
-                    i += 1
+    @staticmethod
+    def _read_lines(proc):
+        """
+        Yield the command output line by line while it is still running, so a node block
+        can be handed to its callback as soon as the next node starts printing.
+        """
+        for chunk in iter(proc.stdout.readline, b''):
+            if not isinstance(chunk, str):
+                chunk = chunk.decode('utf-8', 'replace')
+            for line in chunk.splitlines() or ['']:
+                yield line
 
-        else:
+    @staticmethod
+    def _wait(proc, cmd):
+        proc.stdout.close()
+        if proc.wait() != 0:
             logger.error('Cannot execute command %s ' % cmd)
             raise RuntimeError('Cannot execute command %s ' % cmd)
 
-    def run_salt(self, host_pattern, cmd, callback):
+    def _node_ssh(self, options=''):
+        ssh = 'ssh %s-o ConnectTimeout=3 -o LogLevel=error ' \
+              '-o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no' % options
+        if self.ssh_pool is not None:
+            ssh = '%s %s' % (ssh, self.ssh_pool.node_options())
+        return ssh
+
+    def _parallel_loop(self, cmd, hosts, stdin=None, check_id='-'):
+        """
+        Same as the serial ssh loop but keeps up to self.parallel ssh sessions running at once.
+        Every node writes into its own file so the output is printed back in /etc/hosts order
+        once all sessions are done, the parser downstream sees exactly what the serial loop prints.
+        """
+        output_dir = '/tmp/health_check_%s.d' % str(uuid.uuid4())
+        return "mkdir -p %(dir)s; i=0; for name in %(hosts)s; do " \
+               "while [ $(jobs -rp | wc -l) -ge %(parallel)d ]; do sleep 0.1; done; i=$((i+1)); " \
+               "{ %(ssh)s cbis-admin@\"$name\" '%(cmd)s'%(stdin)s; " \
+               "%(unreachable)s; } > %(dir)s/$(printf %%06d $i) & " \
+               "done; wait; cat %(dir)s/* 2>/dev/null; rm -rf %(dir)s" % \
+               {'dir': output_dir, 'parallel': self.parallel, 'ssh': self._node_ssh('' if stdin else '-n '),
+                'cmd': self._node_cmd(cmd, check_id), 'hosts': hosts, 'unreachable': self._unreachable_frame(),
+                'stdin': ' < %s' % stdin if stdin else ''}
+
+    def run_salt(self, host_pattern, cmd, callback, check_id='-'):
+        """
+        Run cmd on the minions matching host_pattern with salt, which reaches all of them at once.
+        Every minion return is printed by salt as one json document per line as soon as it arrives,
+        it holds the same frame as the ssh loop, which keeps the host names the same.
+        :return: names of the minions which did not return
+        """
         now = datetime.datetime.now()
-        if self.test_flag:
-            cmd = cmd
-        else:
-            cmd = "salt --no-color '%s' cmd.run 'echo \"hostname: `hostname`\"; %s' " % (host_pattern, cmd)
 
-        salt_re = re.compile('^(compute|controller|cephstorage)-\d*:')
-        hostname_re = re.compile('hostname: ')
+        # '*' is the overcloud nodes as with run_xargs, not every minion
+        host_pattern = self._node_pattern(host_pattern)
+        # host_pattern is a grep -E pattern, salt -E matches from the start of the minion id
+        target = "-E '.*(?:%s)'" % host_pattern
+        cmd = "salt --no-color --out=json --out-indent=-1 %s cmd.run " \
+              "'%s' python_shell=True" % (target, self._node_cmd(cmd, check_id))
 
         proc = self.run_shell(cmd)
-        stdout, stderr = proc.communicate()
-        if proc.returncode == 0:
-            lines = stdout.splitlines()
-            i = 0
-            while i < len(lines):
-                line = lines[i]
-                line_each_node = ''
-                if salt_re.match(line):
-                    i += 1
-                    next_line = lines[i]
-                    hostname = None
-                    while not salt_re.match(next_line):
-                        if hostname_re.search(next_line):
-                            hostname = next_line.split(':')[1].strip()
-                        else :
-                            line_each_node += '%s\n\r' % next_line
-                        i += 1
-                        try:
-                            next_line = lines[i]
-                        except IndexError:
-                            break
-                    callback(hostname, line_each_node, now)
-                else:
-                    i += 1
-        else:
+        returned = False
+        skipped = []
+        for line in self._read_lines(proc):
+            if not line.startswith('{'):
+                continue
+            for minion, output in json.loads(line).items():
+                returned = True
+                if not isinstance(output, type(u'')):
+                    output = json.dumps(output)
+                if output.startswith('Minion did not return'):
+                    logger.warning('%s did not return: %s' % (minion, output))
+                    skipped.append(minion)
+                    continue
+                # salt strips the new line closing the frame
+                self._demux_frames(io.BytesIO(output.encode('utf-8')), callback, now)
+
+        proc.stdout.close()
+        # salt exits non zero as soon as one minion fails, only give up when nothing came back
+        if proc.wait() != 0 and not returned:
             logger.error('Cannot execute command %s ' % cmd)
             raise RuntimeError('Cannot execute command %s ' % cmd)
+        return skipped
 
     def get_db_connection(self, in_memory=False):
+        # checkers may be run by the worker threads of check_all, access is serialized with db_lock
         if in_memory:
-            return sqlite3.connect(':memory:')
+            return sqlite3.connect(':memory:', check_same_thread=False)
         else:
-            return sqlite3.connect(PATH + '/' + self.uc + '.db')
+            return sqlite3.connect(self.baseline_db, check_same_thread=False)
+
+    def get_baseline_connection(self):
+        """
+        Connection to the counters kept from one run to the next.
+        A replay must not change them for the next live run, it gets an in memory copy instead.
+        """
+        if self.replayer is None:
+            return self.get_db_connection()
+        conn = self.get_db_connection(in_memory=True)
+        if os.path.exists(self.baseline_db):
+            disk = self.get_db_connection()
+            conn.executescript('\n'.join(disk.iterdump()))
+            disk.close()
+        return conn
+
+    def get_result_connection(self):
+        """One in memory database shared by all checkers of the run"""
+        conn = self.get_db_connection(in_memory=True)
+        for sql in RESULT_SCHEMA:
+            conn.execute(sql % '')
+        return conn
+
+    def save_results(self):
+        """Append the rows of this run to the results_db file"""
+        logger.info('Saving results of run %s to %s' % (self.run_id, self.results_db))
+        self.conn.commit()
+        self.conn.execute('ATTACH DATABASE ? AS saved', (self.results_db,))
+        try:
+            with self.conn:
+                for sql in RESULT_SCHEMA:
+                    self.conn.execute(sql % 'saved.')
+                self.conn.execute('INSERT INTO saved.check_result SELECT * FROM main.check_result WHERE run_id = ?',
+                                  (self.run_id,))
+        finally:
+            self.conn.execute('DETACH DATABASE saved')
 
     @staticmethod
     def build_parser():
@@ -196,6 +920,61 @@ class CheckEngine(object):
         parser.add_argument('-t', '--test', action='store_const', const=True,
                             help='Test Flag for dev mode')
 
+        parser.add_argument('-p', '--parallel', type=int, default=1,
+                            help='Number of nodes to check at the same time')
+
+        parser.add_argument('-b', '--batch', action='store_const', const=True,
+                            help='Run all checks sharing a host pattern in one ssh session per node')
+
+        parser.add_argument('-nm', '--no_multiplex', action='store_const', const=True,
+                            help='Do not share ssh master connections (ControlMaster) between checks')
+
+        parser.add_argument('-db', '--results_db',
+                            help='Append the results of this run to this sqlite file')
+
+        parser.add_argument('--history_db',
+                            default=os.path.join(PATH, 'history.db'),
+                            help='History database, query it with the history subcommand')
+
+        parser.add_argument('--no_history', action='store_const', const=True,
+                            help='Do not record this run in the history database')
+
+        parser.add_argument('-w', '--workers', type=int, default=1,
+                            help='Number of checks to run at the same time (each one uses up to --parallel sessions)')
+
+        parser.add_argument('--inventory_ttl', type=int, default=0,
+                            help='Reuse the undercloud /etc/hosts cached by a previous run for this many seconds')
+
+        parser.add_argument('--no_probe', action='store_const', const=True,
+                            help='Do not check which nodes answer ssh before running the checks')
+
+        parser.add_argument('--transport', choices=['ssh', 'salt'], default='ssh',
+                            help='Reach the overcloud nodes with the ssh loop from the undercloud or with salt')
+
+        parser.add_argument('--agent', action='store_const', const=True,
+                            help='Run all the checks of a node with one collector process per node (ssh transport)')
+
+        parser.add_argument('-z', '--compress', action='store_const', const=True,
+                            help='Gzip the output of every node before it is sent back')
+
+        capture_group = parser.add_mutually_exclusive_group()
+        capture_group.add_argument('--record', metavar='DIR',
+                                   help='Keep the raw output of every host for every check in DIR')
+
+        capture_group.add_argument('--replay', metavar='DIR',
+                                   help='Run the checks on the outputs kept by --record in DIR instead of the cluster')
+
+        parser.add_argument('--metrics', metavar='FILE',
+                            help='Write the metrics of the run to FILE in the Prometheus text format, '
+                                 'e.g. in the directory of the node-exporter textfile collector')
+
+        parser.add_argument('--daemon', action='store_const', const=True,
+                            help='Keep running and run every check again after its interval, '
+                                 'the ssh connections and the host inventory are kept between runs')
+
+        parser.add_argument('--keep_reports', type=int, default=DAEMON_KEEP_REPORTS,
+                            help='With --daemon, keep the reports of this many last runs and remove the older ones')
+
         parser.add_argument('-tc', '--test_case', choices=[cls.__name__ for cls in BaseCheck.__subclasses__()],
                             help="Test case to be checked")
 
@@ -205,27 +984,58 @@ class CheckEngine(object):
 def main(args=sys.argv[1:]):
 
     arg_parser = CheckEngine.build_parser()
+    if args and args[0] == 'history':
+        return history.main(args[1:], arg_parser.description, os.path.join(PATH, 'history.db'))
+
     args = arg_parser.parse_args(args)
+    if args.daemon and args.replay:
+        arg_parser.error('--daemon cannot be used with --replay')
+    if args.daemon and args.record:
+        # every run would write its captures over the ones of the previous run
+        arg_parser.error('--daemon cannot be used with --record')
 
     uc = args.uc_hostname
 
     output_folder = args.output
 
-    now = datetime.datetime.now()
+    # runs of --daemon can start within the same minute
+    time_format = "%Y_%m_%d_%H_%M_%S" if args.daemon else "%Y_%m_%d_%H_%M"
 
-    output_file = "%s/%s-health_check_%s.txt" % (output_folder, uc, now.strftime("%Y_%m_%d_%H_%M"))
+    def report_files(now):
+        return ("%s/%s-health_check_%s.txt" % (output_folder, uc, now.strftime(time_format)),
+                "%s/%s-health_check_%s.csv" % (output_folder, uc, now.strftime(time_format)))
 
-    csv_file = "%s/%s-health_check_%s.csv" % (output_folder, uc, now.strftime("%Y_%m_%d_%H_%M"))
+    output_file, csv_file = report_files(datetime.datetime.now())
 
     test_case = args.test_case
 
-    check_engine = CheckEngine(uc=uc, test_flag=args.test, output_file=output_file, output_csv_file=csv_file)
-    if not test_case:
-        check_engine.check_all()
-    else:
-        check_engine.check(test_case.split(','))
+    # a replay or a test run is not a run of the cluster, it must not show in its history nor in its metrics
+    live = not args.replay and not args.test
+    if not live and args.metrics:
+        logger.warning('--metrics is ignored with --replay and --test')
+
+    check_engine = CheckEngine(uc=uc, test_flag=args.test, output_file=output_file, output_csv_file=csv_file,
+                               parallel=args.parallel, batch=args.batch, multiplex=not args.no_multiplex,
+                               results_db=args.results_db,
+                               history_db=args.history_db if live and not args.no_history else None,
+                               workers=args.workers,
+                               inventory_ttl=args.inventory_ttl, probe=not args.no_probe,
+                               transport=args.transport, agent=args.agent, compress=args.compress,
+                               record=args.record, replay=args.replay,
+                               metrics_file=args.metrics if live else None)
+    try:
+        if args.daemon:
+            check_names = test_case.split(',') if test_case else [cls.__name__ for cls in BaseCheck.__subclasses__()]
+            check_engine.run_daemon(check_names, report_files, keep_reports=args.keep_reports)
+        elif not test_case:
+            check_engine.check_all()
+        else:
+            check_engine.check(test_case.split(','))
+    finally:
+        check_engine.close()
 
-    logger.info('check complete, output locate on : %s, csv file on : %s' % (output_file, csv_file))
+    logger.info('check complete, output locate on : %s, csv file on : %s, timings on : %s' %
+                (output_file, csv_file, check_engine.timings_file))
 
 
 if __name__ == "__main__":
@@ -3,18 +3,58 @@
 
 from __future__ import print_function
 import abc
+import hashlib
 import collections
+import threading
+import facts
+import tables
+
+# host of the rows parsed from an output shared by several hosts, see BaseCheck.ingest
+_SHARED_HOST = object()
+
+# digest of the outputs compared by BaseCheck.ingest, md5 is the fastest here but is disabled by FIPS
+try:
+    _output_hash = hashlib.md5
+    _output_hash(b'')
+except ValueError:
+    _output_hash = hashlib.sha1
 
 
 class BaseCheck(object):
+    # name of the view summary() reads this check's rows from
+    table = None
+    # the command gives the same answer on every node of host_pattern, it is run on one of them only,
+    # see CheckEngine.run_once
+    cluster_scope = False
+    # the check only runs on the SR-IOV nodes, as told by their facts, see CheckEngine.collect_facts
+    sriov_only = False
+    # seconds between two runs of the check with --daemon
+    interval = 900
+    # the hosts with the same output share the rows parsed from it, to turn off for the checks
+    # whose rows depend on more than the output of the host
+    dedup = True
+
     def __init__(self, engine):
         self.engine = engine
-        self.conn = None
+        self.conn = engine.conn
+        self.collected = False
+        # hosts matching host_pattern which could not be reached, see CheckEngine.run_xargs
+        self.unreachable = []
+        # hosts which returned an output
+        self.checked = set()
+        self.rows = []
+        # digest of an output -> rows parsed from it for its first host, see _digest
+        self.parsed = {}
+        # a checker shared by several agent groups ingests from several threads
+        self.lock = threading.Lock()
         self.init_table()
 
-    @abc.abstractmethod
-    def init_table(self, conn):
-        raise NotImplemented()
+    def init_table(self):
+        """Expose the rows of this check in the current run as a view named self.table"""
+        self.conn.execute('DROP VIEW IF EXISTS %s' % self.table)
+        self.conn.execute("CREATE TEMP VIEW %s AS SELECT host, key, value, detail FROM check_result "
+                          "WHERE run_id = '%s' AND check_name = '%s'" %
+                          (self.table, self.engine.run_id, self.__class__.__name__))
 
     @abc.abstractmethod
     def cmd(self):
@@ -28,24 +68,153 @@ class BaseCheck(object):
     def call_back(self, hostname, data, timestamp):
         raise NotImplemented()
 
+    def insert(self, host, key=None, value=None, detail=None):
+        """Buffer one result row, rows are written by flush()"""
+        self.rows.append((host, key, value, detail))
+
+    def flush(self):
+        """Write all buffered rows with executemany in a single transaction"""
+        if self.rows:
+            prefix = (self.engine.run_id, self.__class__.__name__)
+            with self.engine.db_lock, self.conn:
+                self.conn.executemany('insert into check_result (run_id, check_name, host, key, value, detail) '
+                                      'values (?, ?, ?, ?, ?, ?)', [prefix + row for row in self.rows])
+            self.rows = []
+
+    def ingest(self, hostname, data, timestamp):
+        """
+        Parse the output of one host and write its rows in one transaction.
+        An output already parsed for another host is not parsed again, the rows of that host are
+        copied for this one (the outputs are compared by their digest, the outputs themselves are not kept).
+        """
+        if self.engine.recorder is not None:
+            self.engine.recorder.record(self.__class__.__name__, hostname, data, timestamp)
+        timings = self.engine.timings
+        with self.lock:
+            self.checked.add(hostname)
+            start = timings.start()
+            digest = self._digest(data) if self.dedup else None
+            rows = self.parsed.get(digest) if self.dedup else None
+            if rows is None:
+                self.call_back(hostname, data, timestamp)
+                if self.dedup:
+                    self.parsed[digest] = [(_SHARED_HOST if row[0] == hostname else row[0],) + row[1:]
+                                           for row in self.rows]
+            else:
+                self.rows.extend([(hostname if row[0] is _SHARED_HOST else row[0],) + row[1:] for row in rows])
+            timings.count_output(self.__class__.__name__, rows is None)
+            start = timings.stop(start, self.__class__.__name__, 'parse', hostname)
+            self.flush()
+            timings.stop(start, self.__class__.__name__, 'store', hostname)
+
+    @staticmethod
+    def _digest(data):
+        if isinstance(data, type(u'')):
+            data = data.encode('utf-8')
+        return len(data), _output_hash(data).digest()
+
     def _collect(self):
-        self.engine.run_xargs(host_pattern=self.host_pattern(), cmd=self.cmd(), callback=self.call_back)
+        if self.engine.replayer is not None:
+            self.unreachable = self.engine.replayer.replay(self.__class__.__name__, self.ingest)
+            return
+        if self.cluster_scope:
+            self.unreachable = self.engine.run_once(host_pattern=self.host_pattern(), cmd=self.cmd(),
+                                                    callback=self.ingest, check_id=self.__class__.__name__)
+        else:
+            self.unreachable = self.engine.run(host_pattern=self.host_pattern(), cmd=self.cmd(), callback=self.ingest,
+                                               check_id=self.__class__.__name__,
+                                               hosts=self.engine.applicable_hosts(self))
+
+    def applicable(self, host_facts):
+        """Whether the check runs on the node with host_facts, a facts.Facts"""
+        return not self.sriov_only or host_facts.sriov
 
     @abc.abstractmethod
     def summary(self):
         raise NotImplemented()
 
     def check(self):
-        self._collect()
-        return self.summary()
+        if not self.collected:
+            self._collect()
+        if self.engine.recorder is not None:
+            self.engine.recorder.record_unreachable(self.__class__.__name__, self.unreachable)
+        with self.engine.db_lock, self.engine.timings.measure(self.__class__.__name__, 'summary'):
+            output = self.summary()
+        return output + ''.join('%s,UNREACHABLE\n\r' % host for host in self.unreachable)
+
+
+class ConfigCheck(object):
+    """
+    Mixin of the checks on the settings of one config file of the nodes, placed before BaseCheck:
+        class NovaLibvirtConfiguration(ConfigCheck, BaseCheck)
+    so the check still is a direct subclass of BaseCheck. The file is read once per host for all the
+    checks on it (CheckEngine.collect_config) and parsed once into a configstore.ConfigStore,
+    every check only evaluates its rules on the store.
+    """
+    # path of the INI / conf file on the node
+    config_file = None
+    # False for the files which are not INI files, see configstore.ConfigStore
+    config_sections = True
+
+    def cmd(self):
+        if self.engine.test_flag:
+            return 'cat /Users/weerawit/Downloads/compute.log'
+        else:
+            return 'sudo cat %s' % self.config_file
+
+    def call_back(self, hostname, data, timestamp):
+        self.evaluate(hostname, self.engine.config_cache.get(hostname, self.config_file, data,
+                                                             self.config_sections))
+
+    @abc.abstractmethod
+    def evaluate(self, hostname, config):
+        """Insert the rows of hostname from its config, a configstore.ConfigStore"""
+        raise NotImplementedError()
+
+
+class FactsCheck(object):
+    """
+    Mixin of the checks evaluated from the facts of the nodes (facts.FACT_COMMANDS), placed before BaseCheck
+    as ConfigCheck. The facts are gathered once per node for all the checks (CheckEngine.collect_facts),
+    every check only evaluates its rules on them.
+    """
+
+    def cmd(self):
+        if self.engine.test_flag:
+            return 'cat /Users/weerawit/Downloads/compute.log'
+        else:
+            return facts.FACTS_CMD
+
+    def call_back(self, hostname, data, timestamp):
+        host_facts = self.engine.facts.get(hostname, data)
+        if self.applicable(host_facts):
+            self.evaluate(hostname, host_facts)
+
+    @abc.abstractmethod
+    def evaluate(self, hostname, host_facts):
+        """Insert the rows of hostname from its facts.Facts"""
+        raise NotImplementedError()
+
+
+class ApiCheck(object):
+    """
+    Mixin of the undercloud checks on an OpenStack listing, placed before BaseCheck as ConfigCheck.
+    The listings of all the checks are queried in one session on the undercloud by os_query.py
+    (CheckEngine.collect_api) and come as JSON lines: the columns of the legacy CLI table, then the cells
+    of every row. cmd() is the legacy CLI command, os_query.py falls back to it when the API fails.
+    The checks read both with tables.rows, by the column names of the CLI table.
+    """
+    # name of the listing in os_query.LISTINGS
+    query = None
+    # credentials of the cloud of the listing
+    rc_file = '/home/stack/overcloudrc'
 
 
 class PCSStatus(BaseCheck):
     """Check pcs status for all controller """
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS pcs_status (host text, key text, value text)')
-        self.conn.execute('DELETE FROM pcs_status')
+    table = 'pcs_status'
+    interval = 60
+    cluster_scope = True
 
     def cmd(self):
         if self.engine.test_flag:
@@ -64,9 +233,7 @@ class PCSStatus(BaseCheck):
                     clone_set = line.split(':')[1]
                     continue
                 if 'offline' in line.lower() or 'stopped' in line.lower() or 'failed' in line.lower():
-                    self.conn.execute('insert into pcs_status (host) values (?)',
-                                      (hostname,))
-                    self.conn.commit()
+                    self.insert(hostname)
 
     def summary(self):
         output = ''
@@ -78,10 +245,9 @@ class PCSStatus(BaseCheck):
 
 class PCSClusterStatus(BaseCheck):
     """Check pcs cluster status for all controller """
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS pcs_cluster (host text, key text, value text)')
-        self.conn.execute('DELETE FROM pcs_cluster')
+    table = 'pcs_cluster'
+    interval = 60
+    cluster_scope = True
 
     def cmd(self):
         if self.engine.test_flag:
@@ -101,9 +267,7 @@ class PCSClusterStatus(BaseCheck):
                     continue
                 if 'Online' not in line and found_pcsd:
                     values = line.split(':')
-                    self.conn.execute('insert into pcs_cluster (host) values (?)',
-                                      (values[0],))
-                    self.conn.commit()
+                    self.insert(values[0])
 
     def summary(self):
         output = ''
@@ -115,10 +279,9 @@ class PCSClusterStatus(BaseCheck):
 
 class CephHealth(BaseCheck):
     """Check ceph health  for all controller """
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS ceph_health (host text, key text, value text)')
-        self.conn.execute('DELETE FROM ceph_health')
+    table = 'ceph_health'
+    interval = 60
+    cluster_scope = True
 
     def cmd(self):
         if self.engine.test_flag:
@@ -135,9 +298,7 @@ class CephHealth(BaseCheck):
                 if 'HEALTH_OK' in line:
                     continue
                 else:
-                    self.conn.execute('insert into ceph_health (host) values (?)',
-                                      (hostname,))
-                    self.conn.commit()
+                    self.insert(hostname)
 
     def summary(self):
         output = ''
@@ -149,10 +310,8 @@ class CephHealth(BaseCheck):
 
 class CephOSDTree(BaseCheck):
     """Check ceph osd tree  for all controller """
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS ceph_osd_tree (host text, key text, value text)')
-        self.conn.execute('DELETE FROM ceph_osd_tree')
+    table = 'ceph_osd_tree'
+    cluster_scope = True
 
     def cmd(self):
         if self.engine.test_flag:
@@ -172,9 +331,7 @@ class CephOSDTree(BaseCheck):
                     continue
                 if 'osd.' in line and 'up' not in line:
                     values = line.split()
-                    self.conn.execute('insert into ceph_osd_tree (host, key) values (?, ?)',
-                                      (storage_host, values[2].strip()))
-                    self.conn.commit()
+                    self.insert(storage_host, values[2].strip())
 
     def summary(self):
         output = ''
@@ -186,10 +343,7 @@ class CephOSDTree(BaseCheck):
 
 class CephService(BaseCheck):
     """Check ceph's service  for all storage-node """
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS ceph_service (host text, key text, value text)')
-        self.conn.execute('DELETE FROM ceph_service')
+    table = 'ceph_service'
 
     def cmd(self):
         if self.engine.test_flag:
@@ -208,9 +362,7 @@ class CephService(BaseCheck):
                     service_name = line.split('-')[0].strip()
                     continue
                 if 'Active:' in line and 'active' not in line:
-                    self.conn.execute('insert into ceph_service (host) values (?)',
-                                      (hostname,))
-                    self.conn.commit()
+                    self.insert(hostname)
 
     def summary(self):
         output = ''
@@ -230,10 +382,8 @@ class CephOSDConfig(BaseCheck):
      osd_deep_scrub_stride = 1048576
      """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS ceph_osd_config (host text, key text, value text)')
-        self.conn.execute('DELETE FROM ceph_osd_config')
+    table = 'ceph_osd_config'
+    interval = 3600
 
     def cmd(self):
         if self.engine.test_flag:
@@ -251,9 +401,7 @@ class CephOSDConfig(BaseCheck):
             if line:
                 try:
                     key, value = line.split(' = ')
-                    self.conn.execute('insert into ceph_osd_config (host, key, value) values (?, ?, ?)',
-                                      (hostname, key.strip(), value.strip()))
-                    self.conn.commit()
+                    self.insert(hostname, key.strip(), value.strip())
 
                 except ValueError:
                     pass
@@ -275,10 +423,8 @@ class NTPStatus(BaseCheck):
     """Check ntpq -p should see 3 ntp server in all controller
      """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS ntp_status (host text, key text, value text)')
-        self.conn.execute('DELETE FROM ntp_status')
+    table = 'ntp_status'
+    interval = 300
 
     def cmd(self):
         if self.engine.test_flag:
@@ -298,9 +444,7 @@ class NTPStatus(BaseCheck):
                 else:
                     count += 1
 
-        self.conn.execute('insert into ntp_status (host, value) values (?, ?)',
-                          (hostname, str(count)))
-        self.conn.commit()
+        self.insert(hostname, value=str(count))
 
     def summary(self):
         output = ''
@@ -316,10 +460,8 @@ class NTPStat(BaseCheck):
     """Check ntpstat in all controller node, should be synchronized
      """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS ntp_stat (host text, key text, value text)')
-        self.conn.execute('DELETE FROM ntp_stat')
+    table = 'ntp_stat'
+    interval = 300
 
     def cmd(self):
         if self.engine.test_flag:
@@ -334,9 +476,7 @@ class NTPStat(BaseCheck):
         for line in data.splitlines():
             if line:
                 if 'unsynchronised' in line or 'Unable to talk to NTP daemon.' in line:
-                    self.conn.execute('insert into ntp_stat (host) values (?)',
-                                      (hostname, ))
-                    self.conn.commit()
+                    self.insert(hostname)
 
     def summary(self):
         output = ''
@@ -347,14 +487,13 @@ class NTPStat(BaseCheck):
         return output
 
 
-class NoveServiceList(BaseCheck):
+class NoveServiceList(ApiCheck, BaseCheck):
     """Check nova service-list on overcloud
      """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS nova_service_list (host text, key text, value text)')
-        self.conn.execute('DELETE FROM nova_service_list')
+    table = 'nova_service_list'
+    interval = 300
+    query = 'nova_services'
 
     def cmd(self):
         if self.engine.test_flag:
@@ -366,17 +505,9 @@ class NoveServiceList(BaseCheck):
         return 'undercloud'
 
     def call_back(self, hostname, data, timestamp):
-        for line in data.splitlines():
-            if line:
-                if '+' in line or 'Binary' in line:
-                    continue
-                else:
-                    values = line.split('|')
-                    if 'up' not in values[6]:
-
-                        self.conn.execute('insert into nova_service_list (host) values (?)',
-                                          (values[3].strip(), ))
-                        self.conn.commit()
+        for host, state in tables.rows(data, ('Host', 'State')):
+            if 'up' not in state:
+                self.insert(host.strip())
 
     def summary(self):
         output = ''
@@ -387,15 +518,13 @@ class NoveServiceList(BaseCheck):
         return output
 
 
-class NovaList(BaseCheck):
+class NovaList(ApiCheck, BaseCheck):
     """Check nova list on overcloud
     nova list --all --fields host,name,status,power_state
      """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS nova_list (host text, key text, value text)')
-        self.conn.execute('DELETE FROM nova_list')
+    table = 'nova_list'
+    query = 'nova_servers'
 
     def cmd(self):
         if self.engine.test_flag:
@@ -407,17 +536,9 @@ class NovaList(BaseCheck):
         return 'undercloud'
 
     def call_back(self, hostname, data, timestamp):
-        for line in data.splitlines():
-            if line:
-                if '+' in line or 'ID' in line:
-                    continue
-                else:
-                    values = line.split('|')
-                    if 'ACTIVE' not in values[4] or 'Running' not in values[5]:
-
-                        self.conn.execute('insert into nova_list (host) values (?)',
-                                          (values[3].strip(), ))
-                        self.conn.commit()
+        for name, status, power_state in tables.rows(data, ('Name', 'Status', 'Power State')):
+            if 'ACTIVE' not in status or 'Running' not in power_state:
+                self.insert(name.strip())
 
     def summary(self):
         output = ''
@@ -428,14 +549,13 @@ class NovaList(BaseCheck):
         return output
 
 
-class NeutronAgentList(BaseCheck):
+class NeutronAgentList(ApiCheck, BaseCheck):
     """Check neutron agent-list on overcloud
      """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS neutron_agent_list (host text, key text, value text)')
-        self.conn.execute('DELETE FROM neutron_agent_list')
+    table = 'neutron_agent_list'
+    interval = 300
+    query = 'neutron_agents'
 
     def cmd(self):
         if self.engine.test_flag:
@@ -447,17 +567,9 @@ class NeutronAgentList(BaseCheck):
         return 'undercloud'
 
     def call_back(self, hostname, data, timestamp):
-        for line in data.splitlines():
-            if line:
-                if '+' in line or 'agent_type' in line:
-                    continue
-                else:
-                    values = line.split('|')
-                    if ':-)' not in values[4]:
-
-                        self.conn.execute('insert into neutron_agent_list (host) values (?)',
-                                          (values[3].strip(),))
-                        self.conn.commit()
+        for host, alive in tables.rows(data, ('host', 'alive')):
+            if ':-)' not in alive:
+                self.insert(host.strip())
 
     def summary(self):
         output = ''
@@ -468,14 +580,13 @@ class NeutronAgentList(BaseCheck):
         return output
 
 
-class CinderServiceList(BaseCheck):
+class CinderServiceList(ApiCheck, BaseCheck):
     """Check cinder service-lsit on overcloud
      """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS cinder_service_list (host text, key text, value text)')
-        self.conn.execute('DELETE FROM cinder_service_list')
+    table = 'cinder_service_list'
+    interval = 300
+    query = 'cinder_services'
 
     def cmd(self):
         if self.engine.test_flag:
@@ -487,16 +598,9 @@ class CinderServiceList(BaseCheck):
         return 'undercloud'
 
     def call_back(self, hostname, data, timestamp):
-        for line in data.splitlines():
-            if line:
-                if '+' in line or 'Binary' in line:
-                    continue
-                else:
-                    values = line.split('|')
-                    if 'up' not in values[5]:
-                        self.conn.execute('insert into cinder_service_list (host) values (?)',
-                                          (values[2].strip(),))
-                        self.conn.commit()
+        for host, state in tables.rows(data, ('Host', 'State')):
+            if 'up' not in state:
+                self.insert(host.strip())
 
     def summary(self):
         output = ''
@@ -507,35 +611,19 @@ class CinderServiceList(BaseCheck):
         return output
 
 
-class SriovNumberOfVF(BaseCheck):
+class SriovNumberOfVF(FactsCheck, BaseCheck):
     """Check number of vf in compute node, should be 56 (4*14)
      """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS sriov_number_vf (host text, key text, value text)')
-        self.conn.execute('DELETE FROM sriov_number_vf')
-
-    def cmd(self):
-        if self.engine.test_flag:
-            return 'cat /Users/weerawit/Downloads/compute.log'
-        else:
-            return "grep config_sriov.py /usr/lib/systemd/system/sriov.service; sudo ip l |grep vf |wc -l"
+    table = 'sriov_number_vf'
+    interval = 3600
+    sriov_only = True
 
     def host_pattern(self):
         return 'compute-*'
 
-    def call_back(self, hostname, data, timestamp):
-        for line in data.splitlines():
-            if line:
-                if '--vf_num' in line:
-                    values = line.split('--vf_num')
-                    if values[1].strip() == '0':
-                        break
-                else:
-                    self.conn.execute('insert into sriov_number_vf (host, value) values (?, ?)',
-                                  (hostname, line.strip()))
-                    self.conn.commit()
+    def evaluate(self, hostname, host_facts):
+        self.insert(hostname, value=host_facts.get('vfs', ''))
 
     def summary(self):
         output = ''
@@ -551,10 +639,7 @@ class IPAEns6F0andEns6F1Interface(BaseCheck):
     """Check sudo ip a |grep -E ens6f0|ens6f1 should not have DOWN Interface
      """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS ipa_ens6 (host text, key text, value text)')
-        self.conn.execute('DELETE FROM ipa_ens6')
+    table = 'ipa_ens6'
 
     def cmd(self):
         if self.engine.test_flag:
@@ -569,9 +654,7 @@ class IPAEns6F0andEns6F1Interface(BaseCheck):
         for line in data.splitlines():
             if line:
                 if 'UP' not in line:
-                    self.conn.execute('insert into ipa_ens6 (host, value) values (?, ?)',
-                                  (hostname, line.strip()))
-                    self.conn.commit()
+                    self.insert(hostname, value=line.strip())
 
     def summary(self):
         output = ''
@@ -586,10 +669,7 @@ class OvsvsctlGetFailMode(BaseCheck):
     """Check ovs-vsctl get-fail-mode br-ex should be secure in all compute
      """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS get_fail_mode (host text, key text, value text)')
-        self.conn.execute('DELETE FROM get_fail_mode')
+    table = 'get_fail_mode'
 
     def cmd(self):
         if self.engine.test_flag:
@@ -604,9 +684,7 @@ class OvsvsctlGetFailMode(BaseCheck):
         for line in data.splitlines():
             if line:
                 if 'secure' not in line:
-                    self.conn.execute('insert into get_fail_mode (host, value) values (?, ?)',
-                                  (hostname, line.strip()))
-                    self.conn.commit()
+                    self.insert(hostname, value=line.strip())
 
     def summary(self):
         output = ''
@@ -621,10 +699,8 @@ class OvsofctlDumpflow(BaseCheck):
     """Check ovs-ofctl dump-flows br-ex should not contain cookie 0x0 in all compute
      """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS ofctl_dump_flow (host text, key text, value text)')
-        self.conn.execute('DELETE FROM ofctl_dump_flow')
+    table = 'ofctl_dump_flow'
+    interval = 3600
 
     def cmd(self):
         if self.engine.test_flag:
@@ -639,9 +715,7 @@ class OvsofctlDumpflow(BaseCheck):
         for line in data.splitlines():
             if line or 'NXST_FLOW' not in line:
                 if 'cookie=0x0,' in line:
-                    self.conn.execute('insert into ofctl_dump_flow (host, value) values (?, ?)',
-                                  (hostname, line.strip()))
-                    self.conn.commit()
+                    self.insert(hostname, value=line.strip())
 
     def summary(self):
         output = ''
@@ -652,33 +726,19 @@ class OvsofctlDumpflow(BaseCheck):
         return output
 
 
-class CpuFrequency(BaseCheck):
+class CpuFrequency(FactsCheck, BaseCheck):
     """Check all cpu frequency  cpupower frequency-info |grep current CPU
     CPU should more than 1 GHz
      """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS cpu_frequency (host text, key text, value text)')
-        self.conn.execute('DELETE FROM cpu_frequency')
-
-    def cmd(self):
-        if self.engine.test_flag:
-            return 'cat /Users/weerawit/Downloads/compute.log'
-        else:
-            return 'sudo cpupower frequency-info |grep "current CPU"'
+    table = 'cpu_frequency'
 
     def host_pattern(self):
         return '*'
 
-    def call_back(self, hostname, data, timestamp):
-        for line in data.splitlines():
-            if line:
-                if 'current CPU frequency:' in line:
-                    values = line.split(':')
-                    self.conn.execute('insert into cpu_frequency (host, value) values (?, ?)',
-                                  (hostname, values[1]))
-                    self.conn.commit()
+    def evaluate(self, hostname, host_facts):
+        if host_facts.get('cpu_frequency'):
+            self.insert(hostname, value=host_facts.get('cpu_frequency'))
 
     def summary(self):
         output = ''
@@ -691,43 +751,22 @@ class CpuFrequency(BaseCheck):
         return output
 
 
-class HugePageSetting(BaseCheck):
+class HugePageSetting(FactsCheck, BaseCheck):
     """Check all hugepage cat /proc/meminfo |grep -i hugepagesize in all node
     compute node should have 1048576 Kb (Applicable for sriov pod)
      """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS hugepage (host text, key text, value text)')
-        self.conn.execute('DELETE FROM hugepage')
-
-    def cmd(self):
-        if self.engine.test_flag:
-            return 'cat /Users/weerawit/Downloads/compute.log'
-        else:
-            return 'grep config_sriov.py /usr/lib/systemd/system/sriov.service 2>&1; sudo cat /proc/meminfo |grep -i hugepagesize'
+    table = 'hugepage'
+    interval = 3600
+    sriov_only = True
 
     def host_pattern(self):
         return '*'
 
-    def call_back(self, hostname, data, timestamp):
-        for line in data.splitlines():
-            if line:
-                if '--vf_num' in line:
-                    values = line.split('--vf_num')
-                    if values[1].strip() == '0':
-                        break
-                elif 'No such file or directory' in line:
-                    break
-                else:
-                    try:
-                        key, value = line.split(':')
-                        self.conn.execute('insert into hugepage (host, key, value) values (?, ?, ?)',
-                                          (hostname, key.strip(), value.strip()))
-                        self.conn.commit()
-
-                    except ValueError:
-                        pass
+    def evaluate(self, hostname, host_facts):
+        value = host_facts.meminfo().get('Hugepagesize')
+        if value is not None:
+            self.insert(hostname, 'Hugepagesize', value)
 
     def summary(self):
         output = ''
@@ -741,44 +780,22 @@ class HugePageSetting(BaseCheck):
         return output
 
 
-class NovaLibvirtConfiguration(BaseCheck):
+class NovaLibvirtConfiguration(ConfigCheck, BaseCheck):
     """Check nova's configuration for disk_cachemodes on compute
      disk_cachemodes = network=writeback
      sync_power_state_interval = -1
      """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS nova_libvirt (host text, key text, value text)')
-        self.conn.execute('DELETE FROM nova_libvirt')
-
-    def cmd(self):
-        if self.engine.test_flag:
-            return 'cat /Users/weerawit/Downloads/compute.log'
-        else:
-            return 'sudo crudini --get --format=ini /etc/nova/nova.conf libvirt disk_cachemodes 2>&1' \
-                   ';sudo crudini --get --format=ini /etc/nova/nova.conf libvirt sync_power_state_interval 2>&1'
+    table = 'nova_libvirt'
+    interval = 3600
+    config_file = '/etc/nova/nova.conf'
 
     def host_pattern(self):
         return 'compute-*'
 
-    def call_back(self, hostname, data, timestamp):
-        for line in data.splitlines():
-            if line:
-                try:
-                    if 'Parameter not found' in line:
-                        values = line.split(':')
-                        self.conn.execute('insert into nova_libvirt (host, key, value) values (?, ?, ?)',
-                                      (hostname, values[1].strip(), ''))
-                        self.conn.commit()
-                    elif ' = ' in line:
-                        key, value = line.split(' = ')
-                        self.conn.execute('insert into nova_libvirt (host, key, value) values (?, ?, ?)',
-                                          (hostname, key.strip(), value.strip()))
-                        self.conn.commit()
-
-                except ValueError:
-                    pass
+    def evaluate(self, hostname, config):
+        for key in ('disk_cachemodes', 'sync_power_state_interval'):
+            self.insert(hostname, key, config.get('libvirt', key, ''))
 
     def summary(self):
         output = ''
@@ -791,17 +808,17 @@ class NovaLibvirtConfiguration(BaseCheck):
         return output
 
 
-class IronicNodelist(BaseCheck):
+class IronicNodelist(ApiCheck, BaseCheck):
     """Check ironic node-list on undercloud
     Power State should be power-on
     Provisioning State should be active
     Maintenance should be False
      """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS ironic_node_list (host text, key text, value text)')
-        self.conn.execute('DELETE FROM ironic_node_list')
+    table = 'ironic_node_list'
+    interval = 300
+    query = 'ironic_nodes'
+    rc_file = '/home/stack/stackrc'
 
     def cmd(self):
         if self.engine.test_flag:
@@ -813,17 +830,10 @@ class IronicNodelist(BaseCheck):
         return 'undercloud'
 
     def call_back(self, hostname, data, timestamp):
-        for line in data.splitlines():
-            if line:
-                if '+' in line or 'UUID' in line:
-                    continue
-                else:
-                    values = line.split('|')
-                    if 'power on' not in values[4] or 'active' not in values[5] or 'False' not in values[6]:
-
-                        self.conn.execute('insert into ironic_node_list (host) values (?)',
-                                          (values[2].strip(), ))
-                        self.conn.commit()
+        for name, power_state, provisioning_state, maintenance in \
+                tables.rows(data, ('Name', 'Power State', 'Provisioning State', 'Maintenance')):
+            if 'power on' not in power_state or 'active' not in provisioning_state or 'False' not in maintenance:
+                self.insert(name.strip())
 
     def summary(self):
         output = ''
@@ -843,13 +853,19 @@ class EthToolCheck(BaseCheck):
         self.old_data = collections.defaultdict(dict)
         super(EthToolCheck, self).__init__(engine)
 
-    def init_table(self):
+    table = 'ethtools'
+    interval = 3600
+    # the rows of a host depend on its counters of the previous run
+    dedup = False
 
-        self.conn = self.engine.get_db_connection()
-        self.conn.execute('CREATE TABLE IF NOT EXISTS ethtools (host text, key text, value text, is_change text)')
-        for row in self.conn.execute('select host, key, value from ethtools'):
+    def init_table(self):
+        # counters of the previous run are kept on disk, this run is compared against them
+        self.baseline = self.engine.get_baseline_connection()
+        self.baseline.execute('CREATE TABLE IF NOT EXISTS ethtools (host text, key text, value text, is_change text)')
+        for row in self.baseline.execute('select host, key, value from ethtools'):
             self.old_data[row[0]][row[1]] = row[2]
-        self.conn.execute('DELETE FROM ethtools')
+        self.baseline.execute('DELETE FROM ethtools')
+        super(EthToolCheck, self).init_table()
 
     def cmd(self):
         if self.engine.test_flag:
@@ -884,12 +900,17 @@ class EthToolCheck(BaseCheck):
                     except AttributeError:
                         pass
 
-                    self.conn.execute('insert into ethtools (host, key, value, is_change) values (?, ?, ?, ?)', (hostname, key.strip(), value.strip(), is_change))
-                    self.conn.commit()
+                    self.insert(hostname, key.strip(), value.strip(), is_change)
+
+    def flush(self):
+        with self.engine.db_lock, self.baseline:
+            self.baseline.executemany('insert into ethtools (host, key, value, is_change) values (?, ?, ?, ?)',
+                                      self.rows)
+        super(EthToolCheck, self).flush()
 
     def summary(self):
         output = ''
-        for row in self.conn.execute("select distinct host from ethtools where is_change ='Y' "
+        for row in self.conn.execute("select distinct host from ethtools where detail ='Y' "
                                      "order by host",):
             output += '%s,NOK\n\r' % row[0]
 
@@ -900,11 +921,8 @@ class StorageSSDCheck(BaseCheck):
     """Check /opt/MegaRAID/storcli/storcli64 /c0 show should have 2 SSD
 
      """
-    def init_table(self):
-
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS storage_ssd (host text, key text, value text)')
-        self.conn.execute('DELETE FROM storage_ssd')
+    table = 'storage_ssd'
+    interval = 3600
 
     def cmd(self):
         if self.engine.test_flag:
@@ -922,9 +940,7 @@ class StorageSSDCheck(BaseCheck):
                 count += 1
 
         if count < 2:
-            self.conn.execute('insert into storage_ssd (host) values (?)',
-                              (hostname.strip(),))
-            self.conn.commit()
+            self.insert(hostname.strip())
 
     def summary(self):
         output = ''
@@ -935,31 +951,20 @@ class StorageSSDCheck(BaseCheck):
         return output
 
 
-class FreeMemCheck(BaseCheck):
+class FreeMemCheck(FactsCheck, BaseCheck):
     """Check free -h, Total memory should be 251G
 
      """
-    def init_table(self):
-
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS freemem (host text, key text, value text)')
-        self.conn.execute('DELETE FROM freemem')
-
-    def cmd(self):
-        if self.engine.test_flag:
-            return 'cat /Users/weerawit/Downloads/compute.log'
-        else:
-            return "free -h | grep -i mem"
+    table = 'freemem'
 
     def host_pattern(self):
         return '*'
 
-    def call_back(self, hostname, data, timestamp):
-        columns = data.split('        ')
-        if '251G' not in columns[1]:
-            self.conn.execute('insert into freemem (host) values (?)',
-                              (hostname.strip(),))
-            self.conn.commit()
+    def evaluate(self, hostname, host_facts):
+        # Mem: total used free shared buff/cache available
+        columns = host_facts.get('mem', '').split()
+        if len(columns) < 2 or '251G' not in columns[1]:
+            self.insert(hostname.strip())
 
     def summary(self):
         output = ''
@@ -0,0 +1,179 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+One shot collector run on an overcloud node by CheckEngine.collect_agent.
+
+It is piped to the python of the node (python - SPEC), SPEC is the base64 of a json list of
+[check name, command]. Every command is run locally and the outputs are printed back as a single
+json line {check name: output}. Plain cat / grep / wc -l pipelines on files are done in python,
+anything else is handed to bash, so a node spawns one process for all its checks instead of one
+ssh session per check.
+
+Only the standard library of python 2.7 / 3 may be used here.
+"""
+
+from __future__ import print_function
+
+import base64
+import json
+import re
+import shlex
+import subprocess
+import sys
+
+# characters a grep pattern may contain to be matched with python re instead of grep
+BASIC_PATTERN_RE = re.compile(r'^[\w .:=/-]+$')
+EXTENDED_PATTERN_RE = re.compile(r'^[\w .:=/|-]+$')
+
+
+class Unsupported(Exception):
+    pass
+
+
+def split_pipeline(cmd):
+    """
+    Split cmd into commands on ';' and every command into its '|' stages.
+    Raise Unsupported for anything needing a real shell (redirection, substitution, && ...).
+    """
+    commands = [[]]
+    current = ''
+    quote = None
+    for char in cmd:
+        if quote:
+            if char == quote:
+                quote = None
+            current += char
+        elif char in '\'"':
+            quote = char
+            current += char
+        elif char in ';|':
+            commands[-1].append(current)
+            current = ''
+            if char == ';':
+                commands.append([])
+        elif char in '<>&`$\\*?(){}':
+            raise Unsupported(cmd)
+        else:
+            current += char
+    if quote:
+        raise Unsupported(cmd)
+    commands[-1].append(current)
+
+    pipelines = []
+    for stages in commands:
+        stages = [shlex.split(stage) for stage in stages]
+        if len(stages) == 1 and not stages[0]:
+            continue
+        if not all(stages):
+            raise Unsupported(cmd)
+        pipelines.append([stage[1:] if stage[0] == 'sudo' else stage for stage in stages])
+    return pipelines
+
+
+def read_lines(path):
+    with open(path, 'rb') as f:
+        return f.read().decode('utf-8', 'replace').splitlines()
+
+
+def run_cat(args, lines):
+    if lines is not None or not args or any(arg.startswith('-') for arg in args):
+        raise Unsupported('cat')
+    output = []
+    for path in args:
+        try:
+            output.extend(read_lines(path))
+        except IOError as e:
+            sys.stderr.write('cat: %s: %s\n' % (path, e.strerror))
+    return output
+
+
+def run_grep(args, lines):
+    flags = 0
+    extended = invert = False
+    while args and args[0].startswith('-'):
+        for option in args.pop(0)[1:]:
+            if option == 'i':
+                flags = re.IGNORECASE
+            elif option == 'E':
+                extended = True
+            elif option == 'v':
+                invert = True
+            else:
+                raise Unsupported('grep')
+    if not args:
+        raise Unsupported('grep')
+    pattern = args.pop(0)
+    if not (EXTENDED_PATTERN_RE if extended else BASIC_PATTERN_RE).match(pattern):
+        raise Unsupported('grep')
+    pattern_re = re.compile(pattern, flags)
+
+    if lines is not None:
+        if args:
+            raise Unsupported('grep')
+        sources = [(None, lines)]
+    else:
+        if not args:
+            raise Unsupported('grep')
+        sources = []
+        for path in args:
+            try:
+                sources.append((path, read_lines(path)))
+            except IOError as e:
+                sys.stderr.write('grep: %s: %s\n' % (path, e.strerror))
+
+    output = []
+    for path, source in sources:
+        for line in source:
+            if bool(pattern_re.search(line)) != invert:
+                output.append('%s:%s' % (path, line) if len(args) > 1 else line)
+    return output
+
+
+def run_wc(args, lines):
+    if args != ['-l'] or lines is None:
+        raise Unsupported('wc')
+    return [str(len(lines))]
+
+
+NATIVE = {'cat': run_cat, 'grep': run_grep, 'wc': run_wc}
+
+
+def run_native(cmd):
+    output = []
+    for stages in split_pipeline(cmd):
+        lines = None
+        for stage in stages:
+            if stage[0] not in NATIVE:
+                raise Unsupported(cmd)
+            lines = NATIVE[stage[0]](stage[1:], lines)
+        output.extend(lines)
+    return ''.join(['%s\n' % line for line in output])
+
+
+def run_shell(cmd):
+    proc = subprocess.Popen(['/bin/bash', '-c', cmd], stdout=subprocess.PIPE)
+    output = proc.communicate()[0]
+    return output.decode('utf-8', 'replace')
+
+
+def collect(spec):
+    result = {}
+    for name, cmd in spec:
+        if not isinstance(cmd, str):
+            # python 2, json gives unicode
+            cmd = cmd.encode('utf-8')
+        try:
+            result[name] = run_native(cmd)
+        except Unsupported:
+            result[name] = run_shell(cmd)
+    return result
+
+
+def main(args):
+    spec = json.loads(base64.b64decode(args[0]).decode('utf-8'))
+    print(json.dumps(collect(spec)))
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import collections
+import threading
+
+from inventory import ROLES
+
+# (fact, command printing its value on a node), the commands must not hold single quotes
+# as the node command is given to ssh and salt between single quotes
+FACT_COMMANDS = [
+    # --vf_num of the SR-IOV service, empty on the nodes without SR-IOV
+    ('vf_num', 'sed -n "s/.*config_sriov.py.*--vf_num[ =]*\\([0-9]*\\).*/\\1/p" '
+               '/usr/lib/systemd/system/sriov.service 2>/dev/null | head -n 1'),
+    ('vfs', 'sudo ip link show | grep -c vf'),
+    ('vfs_trust_off', 'sudo ip link show | grep vf | grep -c "trust off"'),
+    ('cpus', 'nproc'),
+    ('cpu_frequency', 'sudo cpupower frequency-info | grep "current CPU frequency" | cut -d: -f2-'),
+    ('mem', 'free -h | grep -i mem'),
+    ('nics', 'ls /sys/class/net | xargs'),
+]
+
+# one 'fact=value' line per fact, then the memory and hugepage lines of /proc/meminfo as 'meminfo.<key>=value'
+FACTS_CMD = '; '.join(['echo "%s=$(%s)"' % (fact, cmd) for fact, cmd in FACT_COMMANDS]) + \
+            '; grep -E "^MemTotal|Huge" /proc/meminfo | sed "s/^/meminfo./; s/: */=/"'
+
+
+class Facts(object):
+    """Facts of one node, parsed from the output of FACTS_CMD"""
+
+    def __init__(self, hostname, text):
+        self.hostname = hostname
+        self.values = collections.OrderedDict()
+        for line in text.splitlines():
+            key, sep, value = line.partition('=')
+            if sep:
+                self.values[key.strip()] = value.strip()
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def number(self, key):
+        try:
+            return int(self.values.get(key, ''))
+        except ValueError:
+            return 0
+
+    @property
+    def role(self):
+        for role in ROLES:
+            if role in self.hostname:
+                return role
+        return None
+
+    @property
+    def vf_num(self):
+        return self.number('vf_num')
+
+    @property
+    def sriov(self):
+        return self.vf_num > 0
+
+    def meminfo(self):
+        """Lines of /proc/meminfo kept in the facts, as key -> value with its unit"""
+        return collections.OrderedDict([(key[len('meminfo.'):], value) for key, value in self.values.items()
+                                        if key.startswith('meminfo.')])
+
+
+class FactsTable(object):
+    """
+    Facts of every node of a run, gathered once for all the checks by CheckEngine.collect_facts.
+    The facts are parsed again when the text given for a node changes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # hostname -> (text, Facts)
+        self.hosts = {}
+
+    def get(self, hostname, text=None):
+        """Facts of hostname, parsed from text when given, None when the node has no facts"""
+        with self.lock:
+            cached = self.hosts.get(hostname)
+        if text is None:
+            return cached[1] if cached is not None else None
+        if cached is not None and (cached[0] is text or cached[0] == text):
+            return cached[1]
+        host_facts = Facts(hostname, text)
+        with self.lock:
+            self.hosts[hostname] = (text, host_facts)
+        return host_facts
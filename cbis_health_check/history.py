@@ -0,0 +1,137 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import argparse
+import sqlite3
+from prettytable import PrettyTable
+
+
+# run_ts is stored as 'YYYY-mm-dd HH:MM:SS' so it sorts as text
+HISTORY_SCHEMA = ['CREATE TABLE IF NOT EXISTS run (run_id text primary key, uc text, run_ts text)',
+                  'CREATE INDEX IF NOT EXISTS run_uc_idx ON run (uc, run_ts)',
+                  'CREATE TABLE IF NOT EXISTS run_check (run_id text, uc text, run_ts text, check_name text)',
+                  'CREATE INDEX IF NOT EXISTS run_check_idx ON run_check (uc, check_name, run_ts)',
+                  'CREATE TABLE IF NOT EXISTS result '
+                  '(run_id text, uc text, run_ts text, check_name text, host text, status text, detail text)',
+                  'CREATE INDEX IF NOT EXISTS result_check_idx ON result (uc, check_name, run_ts)',
+                  'CREATE INDEX IF NOT EXISTS result_host_idx ON result (uc, host, check_name, run_ts)']
+
+
+class HistoryStore(object):
+    """
+    Keeps the failing rows of every run so trends can be queried without the old CSV files.
+    The UNREACHABLE rows are kept too but are not failures of the check, the queries only count the NOK rows.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        for sql in HISTORY_SCHEMA:
+            self.conn.execute(sql)
+
+    def record(self, run_id, uc, run_ts, records):
+        """
+        Store one run
+        :param records: list of (check_name, host, status), the 'all,OK' row only marks the check as run
+        """
+        run_ts = run_ts.strftime('%Y-%m-%d %H:%M:%S')
+        check_names = []
+        rows = []
+        for check_name, host, status in records:
+            if check_name not in check_names:
+                check_names.append(check_name)
+            if status != 'OK':
+                # HugePageSetting reports 'host (value)'
+                host, _, detail = host.partition(' (')
+                rows.append((run_id, uc, run_ts, check_name, host.strip(), status, detail.rstrip(')') or None))
+
+        with self.conn:
+            self.conn.execute('insert or replace into run (run_id, uc, run_ts) values (?, ?, ?)', (run_id, uc, run_ts))
+            self.conn.executemany('insert into run_check (run_id, uc, run_ts, check_name) values (?, ?, ?, ?)',
+                                  [(run_id, uc, run_ts, check_name) for check_name in check_names])
+            self.conn.executemany('insert into result (run_id, uc, run_ts, check_name, host, status, detail) '
+                                  'values (?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def failing_hosts(self, uc, check_name, last=30):
+        """Hosts which failed (NOK) check_name in its last runs, most failures first"""
+        runs = self.conn.execute('select run_ts from run_check where uc = ? and check_name = ? '
+                                 'order by run_ts desc limit ?', (uc, check_name, last)).fetchall()
+        if not runs:
+            return []
+
+        return self.conn.execute('select host, count(distinct run_id), min(run_ts), max(run_ts) from result '
+                                 "where uc = ? and check_name = ? and run_ts >= ? and status = 'NOK' "
+                                 'group by host order by 2 desc, host',
+                                 (uc, check_name, runs[-1][0])).fetchall()
+
+    def failing_since(self, uc, host, check_name):
+        """
+        Start of the current failure streak of host on check_name, the runs where host was unreachable
+        neither pass nor fail
+        :return: (first failing run_ts, last passing run_ts before it), None when the host did not fail since
+        its last pass
+        """
+        last_ok = self.conn.execute('select max(rc.run_ts) from run_check rc '
+                                    'where rc.uc = ? and rc.check_name = ? and not exists '
+                                    '(select 1 from result r where r.uc = rc.uc and r.host = ? '
+                                    'and r.check_name = rc.check_name and r.run_ts = rc.run_ts)',
+                                    (uc, check_name, host)).fetchone()[0]
+
+        first_failed = self.conn.execute('select min(run_ts) from result '
+                                         "where uc = ? and host = ? and check_name = ? and run_ts > ? "
+                                         "and status = 'NOK'",
+                                         (uc, host, check_name, last_ok or '')).fetchone()[0]
+        if first_failed is None:
+            return None
+        return first_failed, last_ok
+
+
+def build_parser(description, default_db):
+    parser = argparse.ArgumentParser(
+        prog='history',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='%s history' % description)
+
+    parser.add_argument('-uc', '--uc_hostname',
+                        required=True,
+                        help='Undercloud hostname (sample rst-exp3-uc)')
+
+    parser.add_argument('-c', '--check',
+                        required=True,
+                        help='Check name (sample CephOSDConfig)')
+
+    parser.add_argument('--host',
+                        help='Show since when this host is failing the check')
+
+    parser.add_argument('-n', '--last', type=int, default=30,
+                        help='Number of runs of the check to look at')
+
+    parser.add_argument('--history_db',
+                        default=default_db,
+                        help='History database')
+
+    return parser
+
+
+def main(args, description, default_db):
+    args = build_parser(description, default_db).parse_args(args)
+    store = HistoryStore(args.history_db)
+
+    if args.host:
+        since = store.failing_since(args.uc_hostname, args.host, args.check)
+        if since is None:
+            print('%s did not fail %s since it last passed' % (args.host, args.check))
+        else:
+            print('%s is failing %s since %s (last passed: %s)' %
+                  (args.host, args.check, since[0], since[1] or 'never'))
+        return
+
+    table = PrettyTable(['host', 'failed runs', 'first failed', 'last failed'])
+    table.align["host"] = "l"
+    table.title = '%s failures in the last %d runs' % (args.check, args.last)
+    table.title_align = 'l'
+    table.header_style = 'title'
+    for row in store.failing_hosts(args.uc_hostname, args.check, args.last):
+        table.add_row(list(row))
+    print(table)
@@ -0,0 +1,49 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import json
+import operator
+
+
+def _getter(columns, names):
+    """Function giving the cells of names from the cells of a row, as a tuple"""
+    missing = [name for name in names if name not in columns]
+    if missing:
+        raise ValueError('no column %s in %s' % (', '.join(missing), ' | '.join(columns)))
+    indexes = [columns.index(name) for name in names]
+    if len(indexes) == 1:
+        return lambda cells: (cells[indexes[0]],)
+    return operator.itemgetter(*indexes)
+
+
+def rows(data, names):
+    """
+    Cells of the columns names of every row of an OpenStack listing, as a tuple in the order of names.
+    data is either the table of the legacy CLI:
+        +----+------+
+        | ID | Host |
+        +----+------+
+        | 1  | a    |
+        +----+------+
+    or the JSON lines of os_query.py, the list of the columns then a list of cells per row.
+    The columns are looked up by name in the header once, the rows are then split by position as the checks
+    did, the cells of a CLI table keep their padding so only the cells which are kept need a strip().
+    Raise ValueError on a line which is neither, such as an error of the CLI, or when a column is missing.
+    """
+    get = None
+    for line in data.splitlines():
+        first = line[:1]
+        if first == '|':
+            cells = line.split('|')
+        elif first == '[':
+            cells = json.loads(line)
+        elif first == '+' or not line.strip():
+            continue
+        else:
+            raise ValueError('not an OpenStack listing: %s' % line)
+        if get is None:
+            get = _getter([cell.strip() for cell in cells], names)
+        else:
+            yield get(cells)
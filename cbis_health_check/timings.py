@@ -0,0 +1,184 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import contextlib
+import json
+import threading
+import time
+from prettytable import PrettyTable
+
+# stages of a run, in pipeline order
+#   probe    ssh login test of all nodes before the checks (check '-')
+#   wait     blocked on the transport until the frame of a host is complete: ssh and the node command
+#   remote   duration of the command on the node, as reported in its frame
+#   demux    decoding of the frames
+#   parse    call_back of the checker
+#   store    flush of the rows into sqlite
+#   summary  summary() of the checker
+#   format   table of the checker in the TXT/CSV report
+STAGES = ['probe', 'wait', 'remote', 'demux', 'parse', 'store', 'summary', 'format']
+
+# stages which are spent for one host, the others are shared by all hosts of a check
+HOST_STAGES = ['remote', 'demux', 'parse', 'store']
+
+SLOWEST_HOSTS = 10
+
+if hasattr(time, 'thread_time'):
+    cpu_time = time.thread_time
+else:
+    # python 2 has no per thread clock, the process time is only exact with --workers 1
+    cpu_time = time.clock
+
+
+class Timings(object):
+    """
+    Wall and CPU time of every stage of a run, per check and per host.
+    The check is the check id of the frames, so the commands shared by several checkers
+    are accounted to 'batch' (--batch) or 'collector' (--agent).
+    The outputs counted per check give the share of them parsed once for several hosts.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        # (check, stage) -> [wall, cpu, count]
+        self.stages = {}
+        # (host, check, stage) -> [wall, cpu]
+        self.hosts = {}
+        # check -> [outputs, distinct outputs parsed], see BaseCheck.ingest
+        self.outputs = {}
+        self.check_order = []
+
+    @staticmethod
+    def start():
+        return time.time(), cpu_time()
+
+    def stop(self, start, check, stage, host=None):
+        """Account the time since start to stage, return a new start for the next stage"""
+        now = self.start()
+        self.add(check, stage, now[0] - start[0], now[1] - start[1], host)
+        return now
+
+    @contextlib.contextmanager
+    def measure(self, check, stage, host=None):
+        start = self.start()
+        try:
+            yield
+        finally:
+            self.stop(start, check, stage, host)
+
+    def add(self, check, stage, wall, cpu=0.0, host=None):
+        # called several times for every frame, keep it cheap
+        key = (check, stage)
+        with self.lock:
+            total = self.stages.get(key)
+            if total is None:
+                if check not in self.check_order:
+                    self.check_order.append(check)
+                total = self.stages[key] = [0.0, 0.0, 0]
+            total[0] += wall
+            total[1] += cpu
+            total[2] += 1
+            if host is not None:
+                key = (host, check, stage)
+                total = self.hosts.get(key)
+                if total is None:
+                    total = self.hosts[key] = [0.0, 0.0]
+                total[0] += wall
+                total[1] += cpu
+
+    def count_output(self, check, distinct):
+        with self.lock:
+            counts = self.outputs.get(check)
+            if counts is None:
+                counts = self.outputs[check] = [0, 0]
+            counts[0] += 1
+            if distinct:
+                counts[1] += 1
+
+    def dedup_ratio(self, check):
+        """:return: outputs of check per output actually parsed, None when nothing was parsed"""
+        with self.lock:
+            outputs, distinct = self.outputs.get(check, (0, 0))
+        return float(outputs) / distinct if distinct else None
+
+    def check_seconds(self, check):
+        """:return: wall and cpu time of all stages of check"""
+        wall = cpu = 0.0
+        with self.lock:
+            for stage in STAGES:
+                total = self.stages.get((check, stage))
+                if total and stage != 'remote':
+                    # the remote time is already part of the wait
+                    wall += total[0]
+                    cpu += total[1]
+        return wall, cpu
+
+    def slowest_hosts(self, limit=SLOWEST_HOSTS):
+        """
+        Hosts with the most time spent for them, the wait is left out since with --parallel
+        the first host of a check waits for all the others
+        :return: list of (host, seconds, cpu seconds, slowest check, its seconds)
+        """
+        with self.lock:
+            items = [(key, tuple(total)) for key, total in self.hosts.items()]
+        per_check = {}
+        for (host, check, stage), (wall, cpu) in items:
+            if stage in HOST_STAGES:
+                seconds = per_check.get((host, check), (0.0, 0.0))
+                per_check[(host, check)] = (seconds[0] + wall, seconds[1] + cpu)
+        per_host = {}
+        for (host, check), (seconds, cpu) in per_check.items():
+            total, total_cpu, slowest, slowest_seconds = per_host.get(host, (0.0, 0.0, None, -1.0))
+            if seconds > slowest_seconds:
+                slowest, slowest_seconds = check, seconds
+            per_host[host] = (total + seconds, total_cpu + cpu, slowest, slowest_seconds)
+        hosts = sorted(per_host.items(), key=lambda item: -item[1][0])[:limit]
+        return [(host,) + seconds for host, seconds in hosts]
+
+    def section(self):
+        """Timings section of the TXT report"""
+        table = PrettyTable(['check'] + STAGES + ['total', 'cpu', 'dedup'])
+        table.align['check'] = 'l'
+        table.title = 'Timings in seconds, run took %.1f' % (time.time() - self.started)
+        table.title_align = 'l'
+        for check in list(self.check_order):
+            row = [check]
+            for stage in STAGES:
+                total = self.stages.get((check, stage))
+                row.append('%.3f' % total[0] if total else '')
+            ratio = self.dedup_ratio(check)
+            table.add_row(row + ['%.3f' % seconds for seconds in self.check_seconds(check)] +
+                          ['%.1fx' % ratio if ratio is not None else ''])
+
+        hosts = PrettyTable(['host', 'seconds', 'cpu', 'slowest check', 'check seconds'])
+        hosts.align['host'] = 'l'
+        hosts.title = 'Slowest hosts (%s)' % ' + '.join(HOST_STAGES)
+        hosts.title_align = 'l'
+        for host, seconds, cpu, check, check_seconds in self.slowest_hosts():
+            hosts.add_row([host, '%.3f' % seconds, '%.3f' % cpu, check, '%.3f' % check_seconds])
+
+        return '%s\n%s\n' % (table, hosts)
+
+    def as_dict(self):
+        with self.lock:
+            checks = {}
+            for (check, stage), (wall, cpu, count) in self.stages.items():
+                checks.setdefault(check, {})[stage] = {'wall': wall, 'cpu': cpu, 'count': count}
+            # one [host, check, stage, wall, cpu] row per host stage, it is the biggest part of the file
+            hosts = [[host, check, stage, wall, cpu] for (host, check, stage), (wall, cpu) in self.hosts.items()]
+            outputs = dict([(check, {'outputs': outputs, 'distinct': distinct})
+                            for check, (outputs, distinct) in self.outputs.items()])
+        result = {'started': self.started, 'wall': time.time() - self.started, 'checks': checks, 'hosts': hosts,
+                  'outputs': outputs}
+        result['slowest_hosts'] = [{'host': host, 'seconds': seconds, 'cpu': cpu, 'check': check,
+                                    'check_seconds': check_seconds}
+                                   for host, seconds, cpu, check, check_seconds in self.slowest_hosts()]
+        return result
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            # on python 2 only dumps without indent or sort_keys uses the C encoder
+            f.write(json.dumps(self.as_dict()))
@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import datetime
+import gzip
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def capture_file(directory, check_name):
+    return os.path.join(directory, '%s.jsonl.gz' % check_name)
+
+
+class Recorder(object):
+    """
+    Keeps the raw output of every host for every checker of a run, one gzipped json lines file per checker:
+        {"host": ..., "timestamp": ..., "data": ...} for every host
+        {"unreachable": [...]} once the checker is collected
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = {}
+        self.lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _write(self, check_name, item):
+        line = (json.dumps(item) + '\n').encode('utf-8')
+        with self.lock:
+            if check_name not in self.files:
+                self.files[check_name] = gzip.open(capture_file(self.directory, check_name), 'wb')
+            self.files[check_name].write(line)
+
+    def record(self, check_name, hostname, data, timestamp):
+        self._write(check_name, {'host': hostname, 'timestamp': timestamp.strftime(TIMESTAMP_FORMAT), 'data': data})
+
+    def record_unreachable(self, check_name, hosts):
+        self._write(check_name, {'unreachable': hosts})
+
+    def close(self):
+        with self.lock:
+            for f in self.files.values():
+                f.close()
+            self.files = {}
+
+
+class Replayer(object):
+    """Feeds the outputs kept by a Recorder back to the checkers, without any access to the cluster"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def replay(self, check_name, callback):
+        """
+        Call callback(hostname, data, timestamp) for every host recorded for check_name
+        :return: hosts recorded as unreachable
+        """
+        path = capture_file(self.directory, check_name)
+        if not os.path.exists(path):
+            logger.warning('No capture of %s in %s' % (check_name, self.directory))
+            return []
+
+        unreachable = []
+        with gzip.open(path, 'rb') as f:
+            for line in f:
+                item = json.loads(line.decode('utf-8'))
+                if 'unreachable' in item:
+                    unreachable = item['unreachable']
+                else:
+                    callback(item['host'], item['data'],
+                             datetime.datetime.strptime(item['timestamp'], TIMESTAMP_FORMAT))
+        return unreachable
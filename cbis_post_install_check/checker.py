@@ -3,17 +3,56 @@
 
 from __future__ import print_function
 import abc
+import hashlib
+import threading
+import facts
+
+# host of the rows parsed from an output shared by several hosts, see BaseCheck.ingest
+_SHARED_HOST = object()
+
+# digest of the outputs compared by BaseCheck.ingest, md5 is the fastest here but is disabled by FIPS
+try:
+    _output_hash = hashlib.md5
+    _output_hash(b'')
+except ValueError:
+    _output_hash = hashlib.sha1
 
 
 class BaseCheck(object):
+    # name of the view summary() reads this check's rows from
+    table = None
+    # the command gives the same answer on every node of host_pattern, it is run on one of them only,
+    # see CheckEngine.run_once
+    cluster_scope = False
+    # the check only runs on the SR-IOV nodes, as told by their facts, see CheckEngine.collect_facts
+    sriov_only = False
+    # seconds between two runs of the check with --daemon
+    interval = 3600
+    # the hosts with the same output share the rows parsed from it, to turn off for the checks
+    # whose rows depend on more than the output of the host
+    dedup = True
+
     def __init__(self, engine):
         self.engine = engine
-        self.conn = None
+        self.conn = engine.conn
+        self.collected = False
+        # hosts matching host_pattern which could not be reached, see CheckEngine.run_xargs
+        self.unreachable = []
+        # hosts which returned an output
+        self.checked = set()
+        self.rows = []
+        # digest of an output -> rows parsed from it for its first host, see _digest
+        self.parsed = {}
+        # a checker shared by several agent groups ingests from several threads
+        self.lock = threading.Lock()
         self.init_table()
 
-    @abc.abstractmethod
-    def init_table(self, conn):
-        raise NotImplemented()
+    def init_table(self):
+        """Expose the rows of this check in the current run as a view named self.table"""
+        self.conn.execute('DROP VIEW IF EXISTS %s' % self.table)
+        self.conn.execute("CREATE TEMP VIEW %s AS SELECT host, key, value, detail FROM check_result "
+                          "WHERE run_id = '%s' AND check_name = '%s'" %
+                          (self.table, self.engine.run_id, self.__class__.__name__))
 
     @abc.abstractmethod
     def cmd(self):
@@ -27,25 +66,153 @@ class BaseCheck(object):
     def call_back(self, hostname, data, timestamp):
         raise NotImplemented()
 
+    def insert(self, host, key=None, value=None, detail=None):
+        """Buffer one result row, rows are written by flush()"""
+        self.rows.append((host, key, value, detail))
+
+    def flush(self):
+        """Write all buffered rows with executemany in a single transaction"""
+        if self.rows:
+            prefix = (self.engine.run_id, self.__class__.__name__)
+            with self.engine.db_lock, self.conn:
+                self.conn.executemany('insert into check_result (run_id, check_name, host, key, value, detail) '
+                                      'values (?, ?, ?, ?, ?, ?)', [prefix + row for row in self.rows])
+            self.rows = []
+
+    def ingest(self, hostname, data, timestamp):
+        """
+        Parse the output of one host and write its rows in one transaction.
+        An output already parsed for another host is not parsed again, the rows of that host are
+        copied for this one (the outputs are compared by their digest, the outputs themselves are not kept).
+        """
+        if self.engine.recorder is not None:
+            self.engine.recorder.record(self.__class__.__name__, hostname, data, timestamp)
+        timings = self.engine.timings
+        with self.lock:
+            self.checked.add(hostname)
+            start = timings.start()
+            digest = self._digest(data) if self.dedup else None
+            rows = self.parsed.get(digest) if self.dedup else None
+            if rows is None:
+                self.call_back(hostname, data, timestamp)
+                if self.dedup:
+                    self.parsed[digest] = [(_SHARED_HOST if row[0] == hostname else row[0],) + row[1:]
+                                           for row in self.rows]
+            else:
+                self.rows.extend([(hostname if row[0] is _SHARED_HOST else row[0],) + row[1:] for row in rows])
+            timings.count_output(self.__class__.__name__, rows is None)
+            start = timings.stop(start, self.__class__.__name__, 'parse', hostname)
+            self.flush()
+            timings.stop(start, self.__class__.__name__, 'store', hostname)
+
+    @staticmethod
+    def _digest(data):
+        if isinstance(data, type(u'')):
+            data = data.encode('utf-8')
+        return len(data), _output_hash(data).digest()
+
     def _collect(self):
-        self.engine.run_xargs(host_pattern=self.host_pattern(), cmd=self.cmd(), callback=self.call_back)
+        if self.engine.replayer is not None:
+            self.unreachable = self.engine.replayer.replay(self.__class__.__name__, self.ingest)
+            return
+        if self.cluster_scope:
+            self.unreachable = self.engine.run_once(host_pattern=self.host_pattern(), cmd=self.cmd(),
+                                                    callback=self.ingest, check_id=self.__class__.__name__)
+        else:
+            self.unreachable = self.engine.run(host_pattern=self.host_pattern(), cmd=self.cmd(), callback=self.ingest,
+                                               check_id=self.__class__.__name__,
+                                               hosts=self.engine.applicable_hosts(self))
+
+    def applicable(self, host_facts):
+        """Whether the check runs on the node with host_facts, a facts.Facts"""
+        return not self.sriov_only or host_facts.sriov
 
     @abc.abstractmethod
     def summary(self):
         raise NotImplemented()
 
     def check(self):
-        self._collect()
-        return self.summary()
+        if not self.collected:
+            self._collect()
+        if self.engine.recorder is not None:
+            self.engine.recorder.record_unreachable(self.__class__.__name__, self.unreachable)
+        with self.engine.db_lock, self.engine.timings.measure(self.__class__.__name__, 'summary'):
+            output = self.summary()
+        return output + ''.join('%s,UNREACHABLE\n\r' % host for host in self.unreachable)
+
+
+class ConfigCheck(object):
+    """
+    Mixin of the checks on the settings of one config file of the nodes, placed before BaseCheck:
+        class NovaLibvirtConfiguration(ConfigCheck, BaseCheck)
+    so the check still is a direct subclass of BaseCheck. The file is read once per host for all the
+    checks on it (CheckEngine.collect_config) and parsed once into a configstore.ConfigStore,
+    every check only evaluates its rules on the store.
+    """
+    # path of the INI / conf file on the node
+    config_file = None
+    # False for the files which are not INI files, see configstore.ConfigStore
+    config_sections = True
+
+    def cmd(self):
+        if self.engine.test_flag:
+            return 'cat /Users/weerawit/Downloads/compute.log'
+        else:
+            return 'sudo cat %s' % self.config_file
+
+    def call_back(self, hostname, data, timestamp):
+        self.evaluate(hostname, self.engine.config_cache.get(hostname, self.config_file, data,
+                                                             self.config_sections))
+
+    @abc.abstractmethod
+    def evaluate(self, hostname, config):
+        """Insert the rows of hostname from its config, a configstore.ConfigStore"""
+        raise NotImplementedError()
+
+
+class FactsCheck(object):
+    """
+    Mixin of the checks evaluated from the facts of the nodes (facts.FACT_COMMANDS), placed before BaseCheck
+    as ConfigCheck. The facts are gathered once per node for all the checks (CheckEngine.collect_facts),
+    every check only evaluates its rules on them.
+    """
+
+    def cmd(self):
+        if self.engine.test_flag:
+            return 'cat /Users/weerawit/Downloads/compute.log'
+        else:
+            return facts.FACTS_CMD
+
+    def call_back(self, hostname, data, timestamp):
+        host_facts = self.engine.facts.get(hostname, data)
+        if self.applicable(host_facts):
+            self.evaluate(hostname, host_facts)
+
+    @abc.abstractmethod
+    def evaluate(self, hostname, host_facts):
+        """Insert the rows of hostname from its facts.Facts"""
+        raise NotImplementedError()
+
+
+class ApiCheck(object):
+    """
+    Mixin of the undercloud checks on an OpenStack listing, placed before BaseCheck as ConfigCheck.
+    The listings of all the checks are queried in one session on the undercloud by os_query.py
+    (CheckEngine.collect_api) and come as JSON lines: the columns of the legacy CLI table, then the cells
+    of every row. cmd() is the legacy CLI command, os_query.py falls back to it when the API fails.
+    The checks read both by the column names of the CLI table (tables.rows of cbis_health_check).
+    """
+    # name of the listing in os_query.LISTINGS
+    query = None
+    # credentials of the cloud of the listing
+    rc_file = '/home/stack/overcloudrc'
 
 
 class NTP(BaseCheck):
     """Run timedatectl to verify NTP setting"""
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS ntp (host text, key text, value text)')
-        self.conn.execute('DELETE FROM ntp')
+    table = 'ntp'
+    interval = 300
 
     def cmd(self):
         if self.engine.test_flag:
@@ -61,9 +228,7 @@ class NTP(BaseCheck):
             if line:
                 try:
                     key, value = line.split(':')
-                    self.conn.execute('insert into ntp (host, key, value) values (?, ?, ?)',
-                                 (hostname, key.strip(), value.strip()))
-                    self.conn.commit()
+                    self.insert(hostname, key.strip(), value.strip())
                 except ValueError:
                     pass
 
@@ -76,33 +241,21 @@ class NTP(BaseCheck):
         return output
 
 
-class DashboardTimezone(BaseCheck):
+class DashboardTimezone(ConfigCheck, BaseCheck):
     """Check TIME_ZONE /etc/openstack-dashboard/local_settings in all controller,
     should be Asia/Bangkok """
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS timezone (host text, key text, value text)')
-        self.conn.execute('DELETE FROM timezone')
-
-    def cmd(self):
-        if self.engine.test_flag:
-            return 'cat /Users/weerawit/Downloads/compute.log'
-        else:
-            return 'sudo grep TIME_ZONE /etc/openstack-dashboard/local_settings'
+    table = 'timezone'
+    config_file = '/etc/openstack-dashboard/local_settings'
+    # a python module, a list on its own line is not a section
+    config_sections = False
 
     def host_pattern(self):
         return 'controller-*'
 
-    def call_back(self, hostname, data, timestamp):
-        for line in data.splitlines():
-            if line:
-                try:
-                    key, value = line.split('=')
-                    self.conn.execute('insert into timezone (host, key, value) values (?, ?, ?)',
-                                 (hostname, key.strip(), value.strip()))
-                    self.conn.commit()
-                except ValueError:
-                    pass
+    def evaluate(self, hostname, config):
+        value = config.get(None, 'TIME_ZONE')
+        if value is not None:
+            self.insert(hostname, 'TIME_ZONE', value)
 
     def summary(self):
         output = ''
@@ -116,10 +269,7 @@ class DashboardTimezone(BaseCheck):
 class BMCColdRedundency(BaseCheck):
     """Check Intel_pstate cold redundancy should be disabled by
     run ipmitool raw 0x30 0xc3 second byte should be 00 """
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS bmc (host text, value text)')
-        self.conn.execute('DELETE FROM bmc')
+    table = 'bmc'
 
     def cmd(self):
         if self.engine.test_flag:
@@ -135,9 +285,7 @@ class BMCColdRedundency(BaseCheck):
             if line:
                 try:
                     values = line.split()
-                    self.conn.execute('insert into bmc (host, value) values (?,?)',
-                                 (hostname, values[1].strip()))
-                    self.conn.commit()
+                    self.insert(hostname, value=values[1].strip())
                 except IndexError:
                     pass
 
@@ -152,10 +300,7 @@ class BMCColdRedundency(BaseCheck):
 class APCIPadDisable(BaseCheck):
     """Check acpi_pad should be disable (acpi_pad.disable=1)
     by run sudo cat /proc/cmdline """
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS apcipad (host text, value text)')
-        self.conn.execute('DELETE FROM apcipad')
+    table = 'apcipad'
 
     def cmd(self):
         if self.engine.test_flag:
@@ -170,9 +315,7 @@ class APCIPadDisable(BaseCheck):
         for line in data.splitlines():
             if line:
                 try:
-                    self.conn.execute('insert into apcipad (host, value) values (?,?)',
-                                 (hostname, line.strip()))
-                    self.conn.commit()
+                    self.insert(hostname, value=line.strip())
                 except IndexError:
                     pass
 
@@ -185,35 +328,19 @@ class APCIPadDisable(BaseCheck):
         return output
 
 
-class SriovHugePage(BaseCheck):
+class SriovHugePage(FactsCheck, BaseCheck):
     """Check huge page setting for sriov node (vf_num > 0)
     by run grep Huge /proc/meminfo """
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS sriov (host text, key text, value text)')
-        self.conn.execute('DELETE FROM sriov')
-
-    def cmd(self):
-        if self.engine.test_flag:
-            return 'cat /Users/weerawit/Downloads/compute.log'
-        else:
-            return 'grep config_sriov.py /usr/lib/systemd/system/sriov.service;grep Huge /proc/meminfo'
+    table = 'sriov'
+    sriov_only = True
 
     def host_pattern(self):
         return 'compute-*'
 
-    def call_back(self, hostname, data, timestamp):
-        for line in data.splitlines():
-            if line:
-                if '--vf_num' in line:
-                    values = line.split('--vf_num')
-                    if values[1].strip() == '0':
-                        break
-                else:
-                    key, value = line.split(':')
-                    self.conn.execute('insert into sriov (host, key, value) values (?, ?, ?)',
-                                      (hostname, key.strip(), value.strip()))
-                    self.conn.commit()
+    def evaluate(self, hostname, host_facts):
+        for key, value in host_facts.meminfo().items():
+            if 'Huge' in key:
+                self.insert(hostname, key, value)
 
     def summary(self):
         output = ''
@@ -228,10 +355,8 @@ class RabbitMqBacklog(BaseCheck):
     """Check rabbitmq 's backlog should be 4096 on controller
     by run rabbitmqctl environment | grep backlog
      """
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS rabbitmqctl (host text, value text)')
-        self.conn.execute('DELETE FROM rabbitmqctl')
+    table = 'rabbitmqctl'
+    interval = 900
 
     def cmd(self):
         if self.engine.test_flag:
@@ -247,9 +372,7 @@ class RabbitMqBacklog(BaseCheck):
             if line:
                 if 'backlog' in line:
                     values = line.split(',')
-                    self.conn.execute('insert into rabbitmqctl (host, value) values (?, ?)',
-                                      (hostname, values[1].replace('}', '')))
-                    self.conn.commit()
+                    self.insert(hostname, value=values[1].replace('}', ''))
 
     def summary(self):
         output = ''
@@ -260,31 +383,19 @@ class RabbitMqBacklog(BaseCheck):
         return output
 
 
-class VitrageHostEvacuation(BaseCheck):
+class VitrageHostEvacuation(ConfigCheck, BaseCheck):
     """Check vitrage's configuration on controller for enable_host_evacuate should be False
     """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS vitrage (host text, key text, value text)')
-        self.conn.execute('DELETE FROM vitrage')
-
-    def cmd(self):
-        if self.engine.test_flag:
-            return 'cat /Users/weerawit/Downloads/compute.log'
-        else:
-            return 'grep enable_host_evacuate /etc/vitrage/vitrage.conf'
+    table = 'vitrage'
+    config_file = '/etc/vitrage/vitrage.conf'
 
     def host_pattern(self):
         return 'controller-*'
 
-    def call_back(self, hostname, data, timestamp):
-        for line in data.splitlines():
-            if line:
-                key, value = line.split('=')
-                self.conn.execute('insert into vitrage (host, key, value) values (?, ?, ?)',
-                                  (hostname, key.strip(), value.strip()))
-                self.conn.commit()
+    def evaluate(self, hostname, config):
+        for _, value in config.find('enable_host_evacuate'):
+            self.insert(hostname, 'enable_host_evacuate', value)
 
     def summary(self):
         output = ''
@@ -295,7 +406,7 @@ class VitrageHostEvacuation(BaseCheck):
         return output
 
 
-class NovaDefaultConfiguration(BaseCheck):
+class NovaDefaultConfiguration(ConfigCheck, BaseCheck):
     """Check nova's configuration for default section on
     controller scheduler_max_attempts and scheduler_default_filters
 
@@ -312,30 +423,17 @@ class NovaDefaultConfiguration(BaseCheck):
                                 'NUMATopologyFilter,PciPassthroughFilter,RamFilter,ComputeFilter,' \
                                 'ImagePropertiesFilter,CoreFilter'
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS nova_default (host text, key text, value text)')
-        self.conn.execute('DELETE FROM nova_default')
-
-    def cmd(self):
-        if self.engine.test_flag:
-            return 'cat /Users/weerawit/Downloads/compute.log'
-        else:
-            return 'sudo crudini --format=ini --get  /etc/nova/nova.conf DEFAULT'
+    table = 'nova_default'
+    config_file = '/etc/nova/nova.conf'
 
     def host_pattern(self):
         return 'controller-*'
 
-    def call_back(self, hostname, data, timestamp):
-        for line in data.splitlines():
-            if line:
-                try:
-                    key, value = line.split('=')
-                    self.conn.execute('insert into nova_default (host, key, value) values (?, ?, ?)',
-                                      (hostname, key.strip(), value.strip()))
-                    self.conn.commit()
-                except ValueError:
-                    pass
+    def evaluate(self, hostname, config):
+        for key in ('scheduler_max_attempts', 'scheduler_default_filters'):
+            value = config.get('DEFAULT', key)
+            if value is not None:
+                self.insert(hostname, key, value)
 
     def summary(self):
         output = ''
@@ -351,31 +449,22 @@ class NovaDefaultConfiguration(BaseCheck):
 class SriovZombieScript(BaseCheck):
     """Check zombie script should be installed on sriov nodes by run ls /zabbix_utils/zombie_vf.sh
     """
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS sriov_zombie (host text, key text, value text)')
-        self.conn.execute('DELETE FROM sriov_zombie')
+    table = 'sriov_zombie'
+    sriov_only = True
 
     def cmd(self):
         if self.engine.test_flag:
             return 'cat /Users/weerawit/Downloads/compute.log'
         else:
-            return 'grep config_sriov.py /usr/lib/systemd/system/sriov.service;ls /zabbix_utils/zombie_vf.sh 2>&1'
+            return 'ls /zabbix_utils/zombie_vf.sh 2>&1'
 
     def host_pattern(self):
         return 'compute-*'
 
     def call_back(self, hostname, data, timestamp):
         for line in data.splitlines():
-            if line:
-                if '--vf_num' in line:
-                    values = line.split('--vf_num')
-                    if values[1].strip() == '0':
-                        break
-                elif 'No such file or directory' in line:
-                    self.conn.execute('insert into sriov_zombie (host, key, value) values (?, ?, ?)',
-                                      (hostname, None, None))
-                    self.conn.commit()
+            if 'No such file or directory' in line:
+                self.insert(hostname, None, None)
 
     def summary(self):
         output = ''
@@ -386,34 +475,21 @@ class SriovZombieScript(BaseCheck):
         return output
 
 
-class ZabbixConfig(BaseCheck):
+class ZabbixConfig(ConfigCheck, BaseCheck):
     """Check zabbix's configuration on controller (StartPingers=3, StartPollers >= 15
     in /etc/zabbix/zabbix_server.conf
     """
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS zabbix_conf (host text, key text, value text)')
-        self.conn.execute('DELETE FROM zabbix_conf')
-
-    def cmd(self):
-        if self.engine.test_flag:
-            return 'cat /Users/weerawit/Downloads/compute.log'
-        else:
-            return 'sudo cat /etc/zabbix/zabbix_server.conf'
+    table = 'zabbix_conf'
+    config_file = '/etc/zabbix/zabbix_server.conf'
 
     def host_pattern(self):
         return 'controller-*'
 
-    def call_back(self, hostname, data, timestamp):
-        for line in data.splitlines():
-            if line:
-                try:
-                    key, value = line.split('=')
-                    self.conn.execute('insert into zabbix_conf (host, key, value) values (?, ?, ?)',
-                                      (hostname, key.strip(), value.strip()))
-                    self.conn.commit()
-                except ValueError:
-                    pass
+    def evaluate(self, hostname, config):
+        for key in ('StartPingers', 'StartPollers'):
+            value = config.get(None, key)
+            if value is not None:
+                self.insert(hostname, key, value)
 
     def summary(self):
         output = ''
@@ -426,41 +502,19 @@ class ZabbixConfig(BaseCheck):
         return output
 
 
-class NovaLibvirtConfiguration(BaseCheck):
+class NovaLibvirtConfiguration(ConfigCheck, BaseCheck):
     """Check nova's configuration for disk_cachemodes on compute
      disk_cachemodes = network=writeback
      """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS nova_libvirt (host text, key text, value text)')
-        self.conn.execute('DELETE FROM nova_libvirt')
-
-    def cmd(self):
-        if self.engine.test_flag:
-            return 'cat /Users/weerawit/Downloads/compute.log'
-        else:
-            return 'sudo crudini --get --format=ini /etc/nova/nova.conf libvirt disk_cachemodes 2>&1'
+    table = 'nova_libvirt'
+    config_file = '/etc/nova/nova.conf'
 
     def host_pattern(self):
         return 'compute-*'
 
-    def call_back(self, hostname, data, timestamp):
-        for line in data.splitlines():
-            if line:
-                try:
-                    if 'Parameter not found' in line:
-                        self.conn.execute('insert into nova_libvirt (host, key, value) values (?, ?, ?)',
-                                      (hostname, 'disk_cachemodes', ''))
-                        self.conn.commit()
-                    elif ' = ' in line:
-                        key, value = line.split(' = ')
-                        self.conn.execute('insert into nova_libvirt (host, key, value) values (?, ?, ?)',
-                                          (hostname, key.strip(), value.strip()))
-                        self.conn.commit()
-
-                except ValueError:
-                    pass
+    def evaluate(self, hostname, config):
+        self.insert(hostname, 'disk_cachemodes', config.get('libvirt', 'disk_cachemodes', ''))
 
     def summary(self):
         output = ''
@@ -472,52 +526,26 @@ class NovaLibvirtConfiguration(BaseCheck):
         return output
 
 
-class NovaQuotaConfiguration(BaseCheck):
+class NovaQuotaConfiguration(ConfigCheck, BaseCheck):
     """Check nova's configuration for quota setting on controller (quota_server_groups, quota_server_group_members)
 
     quota_server_groups = 100
     quota_server_group_members = 60
     """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS nova_default (host text, key text, value text)')
-        self.conn.execute('DELETE FROM nova_default')
-
-    def cmd(self):
-        if self.engine.test_flag:
-            return 'cat /Users/weerawit/Downloads/compute.log'
-        else:
-            return 'sudo crudini --get --format=ini /etc/nova/nova.conf DEFAULT quota_server_groups 2>&1;' \
-                   'sudo crudini --get --format=ini /etc/nova/nova.conf DEFAULT quota_server_group_members 2>&1'
+    table = 'nova_quota'
+    config_file = '/etc/nova/nova.conf'
 
     def host_pattern(self):
         return 'controller-*'
 
-    def call_back(self, hostname, data, timestamp):
-        for line in data.splitlines():
-            if line:
-                try:
-                    if 'Parameter not found: quota_server_group_members' in line:
-                        self.conn.execute('insert into nova_default (host, key, value) values (?, ?, ?)',
-                                      (hostname, 'quota_server_group_members', ''))
-                        self.conn.commit()
-                    elif 'Parameter not found: quota_server_groups' in line:
-                        self.conn.execute('insert into nova_default (host, key, value) values (?, ?, ?)',
-                                      (hostname, 'quota_server_groups', ''))
-                        self.conn.commit()
-                    elif ' = ' in line:
-                        key, value = line.split(' = ')
-                        self.conn.execute('insert into nova_default (host, key, value) values (?, ?, ?)',
-                                          (hostname, key.strip(), value.strip()))
-                        self.conn.commit()
-
-                except ValueError:
-                    pass
+    def evaluate(self, hostname, config):
+        for key in ('quota_server_groups', 'quota_server_group_members'):
+            self.insert(hostname, key, config.get('DEFAULT', key, ''))
 
     def summary(self):
         output = ''
-        for row in self.conn.execute("select distinct host from nova_default "
+        for row in self.conn.execute("select distinct host from nova_quota "
                                      "where (key = 'quota_server_group_members' and value != '60') or "
                                      "(key ='quota_server_groups' and value != '100' ) order by host"):
             output += '%s,NOK\n\r' % row[0]
@@ -525,41 +553,19 @@ class NovaQuotaConfiguration(BaseCheck):
         return output
 
 
-class CinderConfiguration(BaseCheck):
+class CinderConfiguration(ConfigCheck, BaseCheck):
     """Check cinder's configuration for scheduler_max_attempts setting on controller
     scheduler_max_attempts = 100
     """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS cinder_default (host text, key text, value text)')
-        self.conn.execute('DELETE FROM cinder_default')
-
-    def cmd(self):
-        if self.engine.test_flag:
-            return 'cat /Users/weerawit/Downloads/compute.log'
-        else:
-            return 'sudo crudini --get --format=ini /etc/cinder/cinder.conf DEFAULT scheduler_max_attempts 2>&1'
+    table = 'cinder_default'
+    config_file = '/etc/cinder/cinder.conf'
 
     def host_pattern(self):
         return 'controller-*'
 
-    def call_back(self, hostname, data, timestamp):
-        for line in data.splitlines():
-            if line:
-                try:
-                    if 'Parameter not found: scheduler_max_attempts' in line:
-                        self.conn.execute('insert into cinder_default (host, key, value) values (?, ?, ?)',
-                                      (hostname, 'scheduler_max_attempts', ''))
-                        self.conn.commit()
-                    elif ' = ' in line:
-                        key, value = line.split(' = ')
-                        self.conn.execute('insert into cinder_default (host, key, value) values (?, ?, ?)',
-                                          (hostname, key.strip(), value.strip()))
-                        self.conn.commit()
-
-                except ValueError:
-                    pass
+    def evaluate(self, hostname, config):
+        self.insert(hostname, 'scheduler_max_attempts', config.get('DEFAULT', 'scheduler_max_attempts', ''))
 
     def summary(self):
         output = ''
@@ -576,10 +582,7 @@ class UndercloudMTUConfig(BaseCheck):
     /etc/sysconfig/network-scripts/ifcfg-eth1
     """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS undercloud_mtu (host text, key text, value text)')
-        self.conn.execute('DELETE FROM undercloud_mtu')
+    table = 'undercloud_mtu'
 
     def cmd(self):
         if self.engine.test_flag:
@@ -605,9 +608,7 @@ class UndercloudMTUConfig(BaseCheck):
                     pass
 
         if count > 0:
-            self.conn.execute('insert into undercloud_mtu (host) values (?)',
-                              (hostname,))
-            self.conn.commit()
+            self.insert(hostname)
 
     def summary(self):
         output = ''
@@ -622,10 +623,7 @@ class UndercloudMTURuntime(BaseCheck):
     ifconfig command
     """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS undercloud_mtu_runtime (host text, key text, value text)')
-        self.conn.execute('DELETE FROM undercloud_mtu_runtime')
+    table = 'undercloud_mtu_runtime'
 
     def cmd(self):
         if self.engine.test_flag:
@@ -651,9 +649,7 @@ class UndercloudMTURuntime(BaseCheck):
                     pass
 
         if count > 0:
-            self.conn.execute('insert into undercloud_mtu_runtime (host) values (?)',
-                              (hostname,))
-            self.conn.commit()
+            self.insert(hostname)
 
     def summary(self):
         output = ''
@@ -663,41 +659,19 @@ class UndercloudMTURuntime(BaseCheck):
         return output
 
 
-class SriovTrustOn(BaseCheck):
+class SriovTrustOn(FactsCheck, BaseCheck):
     """Check VF trust setting should be on in SRIOV compute
     """
 
-    def init_table(self):
-        self.conn = self.engine.get_db_connection(in_memory=True)
-        self.conn.execute('CREATE TABLE IF NOT EXISTS sriov_trust_on (host text, key text, value text)')
-        self.conn.execute('DELETE FROM sriov_trust_on')
-
-    def cmd(self):
-        if self.engine.test_flag:
-            return 'cat /Users/weerawit/Downloads/compute.log'
-        else:
-            return 'grep config_sriov.py /usr/lib/systemd/system/sriov.service;sudo ip link show |grep vf |grep "trust off"'
+    table = 'sriov_trust_on'
+    sriov_only = True
 
     def host_pattern(self):
         return 'compute-*'
 
-    def call_back(self, hostname, data, timestamp):
-        for line in data.splitlines():
-            if line:
-                try:
-                    if line:
-                        if '--vf_num' in line:
-                            values = line.split('--vf_num')
-                            if values[1].strip() == '0':
-                                break
-                        else:
-                            self.conn.execute('insert into sriov_trust_on (host) values (?)',
-                                              (hostname,))
-                            self.conn.commit()
-                            break
-
-                except ValueError:
-                    pass
+    def evaluate(self, hostname, host_facts):
+        if host_facts.number('vfs_trust_off'):
+            self.insert(hostname)
 
     def summary(self):
         output = ''
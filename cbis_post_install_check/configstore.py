@@ -0,0 +1,59 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import threading
+
+
+class ConfigStore(object):
+    """
+    Settings of one INI / conf file, indexed by (section, key).
+    The keys before the first section, as in zabbix_server.conf, are in the section None.
+    A key set twice in a section keeps its last value, as with crudini.
+    Without sections, for the python modules such as the dashboard local_settings where a line
+    like [...] is a list, every key is in the section None.
+    """
+
+    def __init__(self, text, sections=True):
+        self.values = {}
+        section = None
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line[0] in '#;':
+                continue
+            if sections and line.startswith('[') and line.endswith(']'):
+                section = line[1:-1].strip()
+                continue
+            key, sep, value = line.partition('=')
+            if sep:
+                self.values[(section, key.strip())] = value.strip()
+
+    def get(self, section, key, default=None):
+        return self.values.get((section, key), default)
+
+    def find(self, key):
+        """(section, value) of key in every section"""
+        return [(section, value) for (section, name), value in self.values.items() if name == key]
+
+
+class ConfigCache(object):
+    """
+    ConfigStore of every (host, file) of a run, so a file read by several checks is parsed once per host.
+    The store is parsed again when the text given for the file changes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (host, path) -> (text, ConfigStore)
+        self.stores = {}
+
+    def get(self, host, path, text, sections=True):
+        with self.lock:
+            cached = self.stores.get((host, path))
+            if cached is not None and (cached[0] is text or cached[0] == text):
+                return cached[1]
+        store = ConfigStore(text, sections)
+        with self.lock:
+            self.stores[(host, path)] = (text, store)
+        return store
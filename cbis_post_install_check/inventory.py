@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ROLES = ('controller', 'compute', 'cephstorage')
+
+
+class Host(object):
+    """One line of the undercloud /etc/hosts"""
+
+    def __init__(self, line):
+        self.line = line
+        fields = line.split()
+        self.address = fields[0]
+        self.names = fields[1:]
+
+    @property
+    def name(self):
+        """Short host name, as printed by hostname on the node"""
+        return self.names[0].split('.')[0] if self.names else self.address
+
+    def __repr__(self):
+        return 'Host(%s)' % self.line
+
+
+class Inventory(object):
+    """
+    Overcloud hosts taken from the undercloud /etc/hosts once per run,
+    or from a local cache file when it is younger than ttl seconds.
+    """
+
+    def __init__(self, load, cache_file=None, ttl=0):
+        """
+        :param load: function returning the content of the undercloud /etc/hosts
+        """
+        self.load = load
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.all_hosts = None
+        # host_pattern -> hosts, the role patterns of the checks ('compute-*' ...) are indexed on load
+        self.by_pattern = {}
+
+    def _read_cache(self):
+        if not self.cache_file or self.ttl <= 0 or not os.path.exists(self.cache_file):
+            return None
+        if time.time() - os.path.getmtime(self.cache_file) > self.ttl:
+            return None
+        with open(self.cache_file) as f:
+            return json.load(f)
+
+    def _write_cache(self, lines):
+        if self.cache_file and self.ttl > 0:
+            with open(self.cache_file, 'w') as f:
+                json.dump(lines, f)
+
+    def _load(self):
+        lines = self._read_cache()
+        if lines is None:
+            lines = [line.strip() for line in self.load().splitlines()]
+            lines = [line for line in lines if line and not line.startswith('#')]
+            self._write_cache(lines)
+        else:
+            logger.info('Using host inventory cached in %s' % self.cache_file)
+
+        self.all_hosts = [Host(line) for line in lines]
+        for role in ROLES:
+            self._match('%s-*' % role)
+
+    def _match(self, host_pattern):
+        # same selection as grep -E '<host_pattern>' /etc/hosts
+        host_re = re.compile(host_pattern)
+        hosts = [host for host in self.all_hosts if host_re.search(host.line)]
+        self.by_pattern[host_pattern] = hosts
+        return hosts
+
+    def hosts(self, host_pattern):
+        """Hosts whose /etc/hosts line matches host_pattern"""
+        with self.lock:
+            if self.all_hosts is None:
+                self._load()
+            if host_pattern in self.by_pattern:
+                return self.by_pattern[host_pattern]
+            return self._match(host_pattern)
+
+    def invalidate(self):
+        with self.lock:
+            self.all_hosts = None
+            self.by_pattern = {}
@@ -0,0 +1,87 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import collections
+import os
+import time
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _value(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+class TextFile(object):
+    """
+    Metrics in the Prometheus text format, for the textfile collector of node-exporter.
+    All metrics are gauges labelled with the undercloud. A sample replaces the previous one
+    with the same labels, so with --daemon every check keeps the values of its last run.
+    """
+
+    def __init__(self, prefix, uc):
+        self.prefix = prefix
+        self.uc = uc
+        # name -> (help, labels -> value)
+        self.metrics = collections.OrderedDict()
+
+    def add(self, name, help_text, value, **labels):
+        if name not in self.metrics:
+            self.metrics[name] = (help_text, collections.OrderedDict())
+        self.metrics[name][1][tuple(sorted(dict(labels, uc=self.uc).items()))] = value
+
+    def __str__(self):
+        lines = []
+        for name, (help_text, samples) in self.metrics.items():
+            name = '%s_%s' % (self.prefix, name)
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s gauge' % name)
+            for labels, value in samples.items():
+                lines.append('%s{%s} %s' % (name, ','.join('%s="%s"' % (key, _escape(str(label)))
+                                                           for key, label in labels), _value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """
+        Write the metrics to path through a temporary file in the same directory
+        renamed over it, so the collector never reads a partial file
+        """
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            f.write(str(self))
+        os.rename(tmp_path, path)
+
+
+def add_run(metrics, checker_list, records, run_timings):
+    """
+    Add the metrics of a run to metrics
+    :param records: list of (check_name, host, status) of the report
+    :param run_timings: timings.Timings of the run
+    """
+    nok = {}
+    for check_name, host, status in records:
+        if status not in ('OK', 'UNREACHABLE'):
+            nok[check_name] = nok.get(check_name, 0) + 1
+
+    for checker in checker_list:
+        check = checker.__class__.__name__
+        metrics.add('check_duration_seconds', 'Wall time of the check, commands shared with other checks excluded',
+                    run_timings.check_seconds(check)[0], check=check)
+        metrics.add('check_hosts', 'Hosts which returned an output for the check', len(checker.checked), check=check)
+        metrics.add('check_nok', 'Rows of the check which are not OK', nok.get(check, 0), check=check)
+        metrics.add('check_unreachable', 'Hosts of the check which could not be reached', len(checker.unreachable),
+                    check=check)
+        ratio = run_timings.dedup_ratio(check)
+        if ratio is not None:
+            metrics.add('check_dedup_ratio', 'Outputs of the check per output actually parsed', ratio, check=check)
+
+    for (check, stage), (wall, _, _) in sorted(run_timings.stages.items()):
+        metrics.add('stage_seconds', 'Wall time of a stage of a check, see timings.STAGES', wall,
+                    check=check, stage=stage)
+
+    metrics.add('run_duration_seconds', 'Wall time of the run', time.time() - run_timings.started)
+    metrics.add('run_timestamp_seconds', 'Time the run finished', time.time())
@@ -0,0 +1,192 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+One shot OpenStack API query run on the undercloud by CheckEngine.collect_api.
+
+It is piped to the python of the undercloud (python - SPEC), SPEC is the base64 of a json list of
+[check name, listing, rc file, legacy command]. The credentials of every rc file are read once and one
+keystoneauth1 session is opened per rc file, so all the listings of a cloud share one token instead of
+one python client start and one token per listing.
+
+Every listing is printed as JSON lines: the column names of the legacy CLI table, then one list of cells
+per row, so the checks read both the same way (cbis_health_check tables.rows). A listing which cannot be had
+from the API, or every listing when keystoneauth1 is missing, is the output of its legacy command.
+The outputs are printed back as a single json line {check name: output}.
+
+Only the standard library of python 2.7 / 3 and keystoneauth1 may be used here.
+"""
+
+from __future__ import print_function
+
+import base64
+import json
+import subprocess
+import sys
+
+try:
+    from keystoneauth1 import loading
+    from keystoneauth1 import session as ks_session
+except ImportError:
+    loading = ks_session = None
+
+TIMEOUT = 60
+
+# microversion headers of the listings, as asked by the legacy CLI. Without one Ironic answers at 1.1,
+# which has no node name (1.5), ironic node-list asked 1.9. nova and cinder have every column of the checks
+# at the base microversion they answer without a header, neutron has no microversions.
+IRONIC_HEADERS = {'X-OpenStack-Ironic-API-Version': '1.9'}
+
+# power_state of the nova servers as printed by the nova CLI
+POWER_STATES = {0: 'NOSTATE', 1: 'Running', 3: 'Paused', 4: 'Shutdown', 6: 'Crashed', 7: 'Suspended'}
+
+
+def run_shell(cmd):
+    proc = subprocess.Popen(['/bin/bash', '-c', cmd], stdout=subprocess.PIPE)
+    output = proc.communicate()[0]
+    return output.decode('utf-8', 'replace')
+
+
+def read_rc(rc_file):
+    """OS_ variables set by rc_file, it is sourced as the rc files may compute them"""
+    env = {}
+    for line in run_shell('source "%s" >/dev/null; env' % rc_file).splitlines():
+        key, sep, value = line.partition('=')
+        if sep and key.startswith('OS_'):
+            env[key] = value
+    return env
+
+
+class Cloud(object):
+    """keystoneauth1 session with the credentials of one rc file"""
+
+    def __init__(self, env):
+        options = {'auth_url': env['OS_AUTH_URL'], 'username': env['OS_USERNAME'],
+                   'password': env['OS_PASSWORD'],
+                   'project_name': env.get('OS_PROJECT_NAME', env.get('OS_TENANT_NAME'))}
+        # the keystone v2 rc files have no domains
+        for key, option in (('OS_USER_DOMAIN_NAME', 'user_domain_name'),
+                            ('OS_PROJECT_DOMAIN_NAME', 'project_domain_name')):
+            if env.get(key):
+                options[option] = env[key]
+        auth = loading.get_plugin_loader('password').load_from_options(**options)
+        self.session = ks_session.Session(auth=auth, verify=env.get('OS_CACERT') or True, timeout=TIMEOUT)
+        self.interface = env.get('OS_INTERFACE', env.get('OS_ENDPOINT_TYPE', 'public')).replace('URL', '')
+        self.region = env.get('OS_REGION_NAME')
+
+    def endpoint(self, service_types):
+        for service_type in service_types:
+            try:
+                endpoint = self.session.get_endpoint(service_type=service_type, interface=self.interface,
+                                                     region_name=self.region)
+            except Exception:
+                endpoint = None
+            if endpoint:
+                return endpoint.rstrip('/')
+        raise LookupError('no endpoint for %s' % ' or '.join(service_types))
+
+    def get(self, service_types, path, headers=None):
+        url = path if path.startswith('http') else self.endpoint(service_types) + path
+        response = self.session.get(url, headers=headers)
+        return response.json()
+
+    def get_all(self, service_types, path, key, headers=None):
+        """Items of a paginated listing, the next pages are given by nova links and by ironic next"""
+        items = []
+        while path:
+            body = self.get(service_types, path, headers)
+            items.extend(body[key])
+            path = body.get('next')
+            for link in body.get('%s_links' % key, []):
+                if link.get('rel') == 'next':
+                    path = link['href']
+        return items
+
+
+def cell(value):
+    return '%s' % value
+
+
+def nova_services(cloud):
+    columns = ['Id', 'Binary', 'Host', 'Zone', 'Status', 'State', 'Updated_at', 'Disabled Reason']
+    rows = [[cell(service.get('id')), service['binary'], service['host'], service.get('zone'), service['status'],
+             service['state'], cell(service.get('updated_at')), service.get('disabled_reason') or '-']
+            for service in cloud.get(['compute'], '/os-services')['services']]
+    return columns, rows
+
+
+def nova_servers(cloud):
+    # nova list --all --fields host,name,status,power_state
+    columns = ['ID', 'Host', 'Name', 'Status', 'Power State']
+    rows = [[server['id'], cell(server.get('OS-EXT-SRV-ATTR:host')), server['name'], server['status'],
+             POWER_STATES.get(server.get('OS-EXT-STS:power_state'), 'NOSTATE')]
+            for server in cloud.get_all(['compute'], '/servers/detail?all_tenants=1', 'servers')]
+    return columns, rows
+
+
+def neutron_agents(cloud):
+    columns = ['id', 'agent_type', 'host', 'availability_zone', 'alive', 'admin_state_up', 'binary']
+    rows = [[agent['id'], agent['agent_type'], agent['host'], cell(agent.get('availability_zone')),
+             ':-)' if agent['alive'] else 'xxx', cell(agent['admin_state_up']), agent['binary']]
+            for agent in cloud.get(['network'], '/v2.0/agents')['agents']]
+    return columns, rows
+
+
+def cinder_services(cloud):
+    columns = ['Binary', 'Host', 'Zone', 'Status', 'State', 'Updated_at', 'Disabled Reason']
+    rows = [[service['binary'], service['host'], service.get('zone'), service['status'], service['state'],
+             cell(service.get('updated_at')), service.get('disabled_reason') or '-']
+            for service in cloud.get(['volumev3', 'volumev2', 'volume'], '/os-services')['services']]
+    return columns, rows
+
+
+def ironic_nodes(cloud):
+    columns = ['UUID', 'Name', 'Instance UUID', 'Power State', 'Provisioning State', 'Maintenance']
+    rows = [[node['uuid'], cell(node.get('name')), cell(node.get('instance_uuid')), cell(node.get('power_state')),
+             cell(node.get('provision_state')), cell(node.get('maintenance'))]
+            for node in cloud.get_all(['baremetal'], '/v1/nodes', 'nodes', headers=IRONIC_HEADERS)]
+    return columns, rows
+
+
+LISTINGS = {
+    'nova_services': nova_services,
+    'nova_servers': nova_servers,
+    'neutron_agents': neutron_agents,
+    'cinder_services': cinder_services,
+    'ironic_nodes': ironic_nodes,
+}
+
+
+def collect(spec):
+    result = {}
+    # rc file -> Cloud, or the error opening it
+    clouds = {}
+    for name, listing, rc_file, legacy_cmd in spec:
+        if not isinstance(legacy_cmd, str):
+            # python 2, json gives unicode
+            legacy_cmd = legacy_cmd.encode('utf-8')
+        try:
+            if loading is None:
+                raise ImportError('keystoneauth1 is not installed')
+            if rc_file not in clouds:
+                try:
+                    clouds[rc_file] = Cloud(read_rc(rc_file))
+                except Exception as e:
+                    clouds[rc_file] = e
+            if isinstance(clouds[rc_file], Exception):
+                raise clouds[rc_file]
+            columns, rows = LISTINGS[listing](clouds[rc_file])
+            result[name] = ''.join(['%s\n' % json.dumps(row) for row in [columns] + rows])
+        except Exception as e:
+            sys.stderr.write('%s from the API failed (%s), running %s\n' % (listing, e, legacy_cmd))
+            result[name] = run_shell(legacy_cmd)
+    return result
+
+
+def main(args):
+    spec = json.loads(base64.b64decode(args[0]).decode('utf-8'))
+    print(json.dumps(collect(spec)))
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])